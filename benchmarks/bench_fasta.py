@@ -0,0 +1,73 @@
+'''
+Compare the local fasta readers by extracting random regions from a synthetic reference.
+
+    python benchmarks/bench_fasta.py --size 100000000 --regions 20000
+'''
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from extractome.extract import write_record
+from extractome.fasta import BACKENDS, FastaWriter, open_fasta
+
+
+def write_reference(path, chromosomes, size, seed=0):
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+    with FastaWriter(path) as writer:
+        for i in range(chromosomes):
+            writer.begin(f"chr{i + 1}")
+            for start in range(0, size, 1 << 24):
+                writer.write(memoryview(bases[rng.integers(0, 4, min(1 << 24, size - start))]))
+            writer.end()
+
+
+def random_regions(chromosomes, size, count, length, seed=1):
+    rng = np.random.default_rng(seed)
+    regions = {}
+    for i in range(chromosomes):
+        starts = np.sort(rng.integers(0, size - length, count // chromosomes))
+        ends = starts + rng.integers(1, length, len(starts))
+        regions[f"chr{i + 1}"] = (starts, ends)
+    return regions
+
+
+def run(reference, regions, backend, output):
+    reader = open_fasta(reference, backend=backend)
+    t0 = time.perf_counter()
+    with FastaWriter(output) as writer:
+        for chr, (starts, ends) in regions.items():
+            write_record(writer, reader, chr, starts, ends)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chromosomes", type=int, default=4)
+    parser.add_argument("--size", type=int, default=25_000_000, help="bases per chromosome")
+    parser.add_argument("--regions", type=int, default=20000)
+    parser.add_argument("--length", type=int, default=5000, help="maximum region length")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        reference = os.path.join(tmpdir, "ref.fa")
+        write_reference(reference, args.chromosomes, args.size)
+        regions = random_regions(args.chromosomes, args.size, args.regions, args.length)
+        bases = int(sum((ends - starts).sum() for starts, ends in regions.values()))
+
+        results = {}
+        for backend in BACKENDS:
+            seconds = min(run(reference, regions, backend, os.path.join(tmpdir, f"{backend}.fa"))
+                          for _ in range(args.repeat))
+            results[backend] = {"seconds": round(seconds, 4), "mbases_per_second": round(bases / seconds / 1e6, 1)}
+
+    print(json.dumps({"bases": bases, "regions": args.regions, "results": results}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+'''
+Benchmark suite for extraction and liftover scaling.  Synthetic references and bed files are generated locally from
+fixed seeds, so results are reproducible and can be compared across commits.
+
+    python benchmarks/run_benchmarks.py --preset small --out results.json
+    python benchmarks/run_benchmarks.py --preset small --compare baseline.json
+
+Each case is a (regions, contigs) pair.  A fraction of the regions are nested in or overlap another region.  Timed:
+feature.parse_bed, extract.build_region_dict, each stage of extract_genome (see extractome.metrics), load_liftover of
+the written chain, Liftover.map on a sample of features, and Liftover.map_many on all of them.
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_fasta import write_reference
+from extractome.extract import build_region_dict, extract_genome, parse_args as parse_extract_args
+from extractome.feature import parse_bed, parse_columns
+from extractome.liftover import load_liftover
+
+# (regions, contigs) cases of each preset
+PRESETS = {
+    "small": [(1000, 4), (10000, 4), (10000, 1000)],
+    "medium": [(100000, 4), (100000, 1000), (1000000, 25)],
+    "large": [(1000000, 5000), (10000000, 25)]
+}
+
+GENOME_SIZE = 100_000_000
+
+
+def write_regions(path, contigs, contig_size, count, overlap=0.2, max_length=5000, seed=1):
+    '''
+    Write an unsorted bed file of random regions.  A fraction, overlap, of the regions are placed relative to
+    another region:  half nested within it, half overlapping its end.
+    '''
+    rng = np.random.default_rng(seed)
+    chroms = rng.integers(0, contigs, count)
+    lengths = rng.integers(1, max_length, count)
+    starts = rng.integers(0, contig_size - max_length, count)
+
+    related = np.flatnonzero(rng.random(count) < overlap)
+    related = related[related > 0]
+    parents = rng.integers(0, related, len(related)) if len(related) > 0 else related
+    chroms[related] = chroms[parents]
+    nested = rng.random(len(related)) < 0.5
+    offsets = (rng.random(len(related)) * lengths[parents]).astype(np.int64)
+    starts[related] = starts[parents] + offsets
+    lengths[related] = np.where(nested, np.maximum(1, (lengths[parents] - offsets) // 2), lengths[related])
+    ends = np.minimum(starts + lengths, contig_size)
+
+    with open(path, "w") as f:
+        for i in range(0, count, 100000):
+            f.write("".join(f"chr{c + 1}\t{s}\t{e}\tr{j}\n" for j, c, s, e in
+                            zip(range(i, min(i + 100000, count)), chroms[i:i + 100000].tolist(),
+                                starts[i:i + 100000].tolist(), ends[i:i + 100000].tolist())))
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+
+def run_case(workdir, references, count, contigs, map_sample):
+    if contigs not in references:
+        references[contigs] = os.path.join(workdir, f"ref_{contigs}.fa")
+        write_reference(references[contigs], contigs, GENOME_SIZE // contigs)
+    reference = references[contigs]
+
+    bed = os.path.join(workdir, f"regions_{count}_{contigs}.bed")
+    write_regions(bed, contigs, GENOME_SIZE // contigs, count)
+    timings = {}
+
+    with open(bed) as f:
+        features, timings["parse_bed"] = timed(parse_bed, f)
+    _, timings["build_region_dict"] = timed(build_region_dict, features)
+    _, timings["parse_columns"] = timed(parse_columns, bed)
+
+    output = os.path.join(workdir, f"out_{count}_{contigs}")
+    metrics = extract_genome(parse_extract_args([bed, "--fasta", reference, "--name", "X", "--output", output]))
+    for stage in metrics.stages:
+        timings["extract: " + stage.name] = stage.seconds
+
+    liftover, timings["load_liftover"] = timed(load_liftover, os.path.join(output, "X.chain"))
+    sample = features[:map_sample]
+    _, seconds = timed(lambda: [liftover.map(f) for f in sample])
+    timings[f"Liftover.map ({len(sample)} features)"] = seconds
+
+    chroms = np.array([f.chr for f in features])
+    starts = np.array([f.start for f in features], dtype=np.int64)
+    ends = np.array([f.end for f in features], dtype=np.int64)
+    _, timings["Liftover.map_many"] = timed(liftover.map_many, chroms, starts, ends)
+
+    return {"regions": count, "contigs": contigs, "timings": {k: round(v, 4) for k, v in timings.items()}}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline, results):
+    '''
+    Print the timings of results relative to a baseline run, matched by case and measurement
+    '''
+    cases = {(c["regions"], c["contigs"]): c["timings"] for c in baseline["cases"]}
+    print(f"baseline {baseline.get('commit')}, current {results.get('commit')}")
+    for case in results["cases"]:
+        base = cases.get((case["regions"], case["contigs"]))
+        if base is None:
+            continue
+        print(f"\n{case['regions']} regions, {case['contigs']} contigs")
+        for name, seconds in case["timings"].items():
+            if name in base and base[name] > 0:
+                print(f"  {name:45s} {base[name]:10.4f} {seconds:10.4f} {seconds / base[name]:7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preset", choices=PRESETS.keys(), default="small")
+    parser.add_argument("--case", action="append", default=None, metavar="REGIONS,CONTIGS",
+                        help="run this case instead of the preset, may be repeated")
+    parser.add_argument("--map-sample", type=int, default=100000, help="number of features lifted one by one with Liftover.map")
+    parser.add_argument("--out", default=None, help="write the results to this json file")
+    parser.add_argument("--compare", default=None, help="json results of a previous run to compare against")
+    parser.add_argument("--workdir", default=None, help="directory for the generated data, default a temporary directory")
+    args = parser.parse_args()
+
+    cases = [tuple(int(v) for v in c.split(",")) for c in args.case] if args.case else PRESETS[args.preset]
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": []
+    }
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        references = {}
+        for count, contigs in cases:
+            print(f"{count} regions, {contigs} contigs", file=sys.stderr)
+            results["cases"].append(run_case(workdir, references, count, contigs, args.map_sample))
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    elif args.out is None:
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import argparse
+import numpy as np
+from extractome.chralias import read_chromalias
+from extractome.extract import build_coordmap, build_region_columns, non_negative_int, open_reference, \
+    positive_int, resolve_chromosomes, write_genome_json, write_regions_bed
+from extractome.fasta import BACKENDS, FastaWriter, LINE_WIDTH
+from extractome.inputs import load_inputs
+from extractome.regions import merge_intervals
+
+# Union intervals up to this size are fetched with a single read and shared by all sets, larger ones are
+# streamed in chunks per region to keep memory bounded
+MAX_SHARED_READ = 1 << 24
+
+'''
+Build many extracted genomes from one reference in a single pass.  The reference is opened once, and each base
+covered by the union of all region sets is read once and written to every set that includes it.
+'''
+def extract_batch(args):
+
+    if not os.path.exists(args.output):
+        os.mkdir(args.output)
+
+    sets = read_batch_manifest(args.manifest)
+
+    # Region files are parsed while the reference is opened
+    (fasta_index, fasta_reader), columns = load_inputs([s.regions for s in sets], lambda: open_reference(args))
+
+    for s, c in zip(sets, columns):
+        s.region_dict = build_region_columns(c)
+        s.chrlist = sorted(s.region_dict.keys())
+    alias_rows = read_chromalias(args.chrom_alias) if args.chrom_alias else None
+    resolve_chromosomes(sorted(set(chr for s in sets for chr in s.chrlist)), fasta_reader, alias_rows)
+
+    for s in sets:
+        s.coordmap = build_coordmap(s.region_dict, s.chrlist, fasta_reader, args.pad, args.merge_gap)
+        s.fasta_name = f"{s.name}.fa.gz" if args.bgzip else f"{s.name}.fa"
+
+    '''
+    Create fasta files
+    '''
+    writers = {s.name: FastaWriter(os.path.join(args.output, s.fasta_name), args.line_width, args.bgzip, args.threads)
+               for s in sets}
+    try:
+        for chr in sorted(set(chr for s in sets for chr in s.chrlist)):
+            write_shared_record(writers, fasta_reader, chr, [s for s in sets if chr in s.coordmap.starts])
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    '''
+    Create .chain, regions, and genome json files for each set
+    '''
+    for s in sets:
+        s.coordmap.write_chain(os.path.join(args.output, f"{s.name}.chain"), fasta_reader.size)
+        liftover = s.coordmap.liftover(fasta_reader.size)
+        write_regions_bed(os.path.join(args.output, f"{s.name}.regions.bed"), s.region_dict, s.chrlist, liftover)
+        write_genome_json(os.path.join(args.output, f"{s.name}.json"), s.name, s.fasta_name, args.bgzip)
+
+
+def write_shared_record(writers, fasta_reader, chr, sets):
+    '''
+    Write the record for chr to the writer of every set with regions on it.  The union of all sets' regions is
+    read once, each set's regions are sliced out of the shared sequence.
+    '''
+    coordmaps = [s.coordmap for s in sets]
+    starts = np.concatenate([c.starts[chr] for c in coordmaps])
+    ends = np.concatenate([c.ends[chr] for c in coordmaps])
+    order = np.argsort(starts, kind='stable')
+    ustarts, uends = merge_intervals(starts[order], ends[order], 0)
+    fasta_reader.prefetch(chr, ustarts, uends)
+
+    for s in sets:
+        writers[s.name].begin(chr)
+
+    # Sets' regions are sorted by start and each lies within a single union interval, so a pointer per set
+    # sweeps them in order
+    pointers = [0] * len(sets)
+    for ustart, uend in zip(ustarts.tolist(), uends.tolist()):
+        seq = fasta_reader.slice({"chr": chr, "start": ustart + 1, "end": uend}) \
+            if uend - ustart <= MAX_SHARED_READ else None
+
+        for k, s in enumerate(sets):
+            writer = writers[s.name]
+            rstarts, rends = s.coordmap.starts[chr], s.coordmap.ends[chr]
+            i = pointers[k]
+            while i < len(rstarts) and rstarts[i] < uend:
+                start, end = int(rstarts[i]), int(rends[i])
+                if seq is not None:
+                    writer.write(seq[start - ustart:end - ustart])
+                else:
+                    for chunk in fasta_reader.chunks(chr, start, end):
+                        writer.write(chunk)
+                i += 1
+            pointers[k] = i
+
+    for s in sets:
+        writers[s.name].end()
+
+
+class RegionSet:
+
+    def __init__(self, name, regions):
+        self.name = name
+        self.regions = regions
+
+
+def read_batch_manifest(path):
+    '''
+    Read a batch manifest:  tab delimited lines of output name and regions file.  Relative regions paths are
+    resolved against the manifest's directory.
+    '''
+    sets = []
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            tokens = line.split('\t')
+            if len(tokens) < 2:
+                raise ValueError(f"Expected name and regions file: {line}")
+            name, regions = tokens[0], tokens[1]
+            if not (regions.startswith('http://') or regions.startswith('https://') or os.path.isabs(regions)):
+                regions = os.path.join(base, regions)
+            sets.append(RegionSet(name, regions))
+
+    names = [s.name for s in sets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate names in batch manifest {path}")
+    return sets
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("manifest", help="tab delimited file of name and bed file for each extracted genome, required")
+    parser.add_argument("--fasta", default=None, help="reference fasta file, required if --genome is not specified")
+    parser.add_argument("--genome", help="igv.js genome id (e.g. hg38)")
+    parser.add_argument("--chrom-alias", default=None,
+                        help="chromosome alias file (igv.js chromAlias format) mapping region chromosome names to fasta names")
+    parser.add_argument("--fasta-backend", choices=BACKENDS, default="pysam",
+                        help="reader for local fasta files, mmap requires an uncompressed fasta with a .fai index")
+    parser.add_argument("--cache-dir", default=None, help="directory for the cached genome catalog, default ~/.cache/extractome")
+    parser.add_argument("--offline", action="store_true", help="resolve --genome from the cached catalog only")
+    parser.add_argument("--output", help="output directory name", default="output")
+    parser.add_argument("--line-width", type=positive_int, default=LINE_WIDTH, help="bases per line in the output fasta")
+    parser.add_argument("--merge-gap", type=non_negative_int, default=None,
+                        help="merge regions separated by no more than this many bases, 0 merges overlapping and adjacent regions")
+    parser.add_argument("--pad", type=non_negative_int, default=0, help="extend each region by this many bases on both sides")
+    parser.add_argument("--threads", type=int, default=1, help="threads for --bgzip compression")
+    parser.add_argument("--bgzip", action="store_true", help="write block gzipped fasta with .fai and .gzi indexes")
+    return parser.parse_args(argv)
+
+
+def main():
+    extract_batch(parse_args())
+
+
+if __name__ == "__main__":
+    main()
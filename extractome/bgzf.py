@@ -0,0 +1,85 @@
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum uncompressed bytes per block, as used by htslib
+BLOCK_SIZE = 0xff00
+
+# Empty block marking the end of a BGZF file
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compress_block(data, level=6):
+    '''
+    Compress data into a single BGZF block: a gzip member with the "BC" extra field holding the block size
+    '''
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = c.compress(data) + c.flush()
+    header = struct.pack('<BBBBIBBHBBHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(deflated) + 25)
+    footer = struct.pack('<II', zlib.crc32(data), len(data))
+    return header + deflated + footer
+
+
+class BgzfWriter:
+    '''
+    Write a BGZF (block gzip) file as a stream, compressing blocks in a pool of threads.  The ".gzi" index of
+    compressed / uncompressed block offsets is written alongside on close.
+    '''
+
+    def __init__(self, path, threads=1, level=6, write_index=True):
+        self.path = path
+        self.level = level
+        self.write_index = write_index
+        self.out = open(path, "wb")
+        self.buffer = bytearray()
+        self.pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        self.max_pending = 4 * threads
+        self.pending = deque()
+        self.offset = 0                # compressed bytes written
+        self.uoffset = 0               # uncompressed bytes written
+        self.index = []                # (compressed offset, uncompressed offset) of each block after the first
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= BLOCK_SIZE:
+            n = len(self.buffer) - len(self.buffer) % BLOCK_SIZE
+            for i in range(0, n, BLOCK_SIZE):
+                self.submit(bytes(self.buffer[i:i + BLOCK_SIZE]))
+            del self.buffer[:n]
+
+    def submit(self, block):
+        if self.pool is None:
+            self.write_block(compress_block(block, self.level), len(block))
+        else:
+            self.pending.append((self.pool.submit(compress_block, block, self.level), len(block)))
+            while len(self.pending) > self.max_pending:
+                self.drain()
+
+    def drain(self):
+        future, size = self.pending.popleft()
+        self.write_block(future.result(), size)
+
+    def write_block(self, compressed, size):
+        if self.offset > 0:
+            self.index.append((self.offset, self.uoffset))
+        self.out.write(compressed)
+        self.offset += len(compressed)
+        self.uoffset += size
+
+    def close(self):
+        if len(self.buffer) > 0:
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while self.pending:
+            self.drain()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.out.write(EOF_BLOCK)
+        self.out.close()
+
+        if self.write_index:
+            with open(self.path + ".gzi", "wb") as f:
+                f.write(struct.pack('<Q', len(self.index)))
+                for entry in self.index:
+                    f.write(struct.pack('<QQ', *entry))
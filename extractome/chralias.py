@@ -1,3 +1,4 @@
+from extractome.stream import getstream
 
 
 def build_aliastable(chrs):
@@ -32,4 +33,48 @@ def get_alias(c):
         if c == 'MT':
             return 'MT'
         else:
-            return f'chr{c}'
\ No newline at end of file
+            return f'chr{c}'
+
+def read_chromalias(path):
+    '''
+    Read a chromosome alias file in the igv.js "chromAlias" format:  tab delimited lines, each listing the names of
+    one sequence.  Lines starting with "#" are headers or comments.
+    :return: list of name lists
+    '''
+    rows = []
+    with getstream(path) as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            names = [n for n in line.rstrip('\n').rstrip('\r').split('\t') if n]
+            if len(names) > 0:
+                rows.append(names)
+    return rows
+
+
+def resolve_aliases(names, sequences, alias_rows=None):
+    '''
+    Resolve chromosome names (e.g. from a bed file) to the sequence names of a fasta.  A name resolves to itself if
+    it is a sequence name, else through the alias rows, else through the chr prefix rules of build_aliastable.
+    :param sequences: the fasta sequence names
+    :param alias_rows: name lists as returned by read_chromalias
+    :return: tuple (dictionary of name -> sequence name, list of unresolved names)
+    '''
+    sequences = set(sequences)
+    table = build_aliastable(sequences)
+    for row in alias_rows or []:
+        target = next((n for n in row if n in sequences), None)
+        if target is not None:
+            for n in row:
+                table[n] = target
+
+    resolved = {}
+    unresolved = []
+    for name in names:
+        if name in sequences:
+            resolved[name] = name
+        elif name in table and table[name] in sequences:
+            resolved[name] = table[name]
+        else:
+            unresolved.append(name)
+    return resolved, unresolved
@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+from extractome import regions
+from extractome.liftover import Chain, Liftover, load_liftover, overlapping_blocks, project
+
+COORDS_VERSION = 1
+COORDS_ARRAYS = ["starts", "ends", "endsMax", "offsets"]
+
+
+class CoordinateMap:
+    '''
+    Map between original genome coordinates and extracted genome coordinates.  Each chromosome of the extracted
+    genome is the concatenation of its regions, so the offset of a region in the extracted sequence is the running
+    sum of the sizes of the regions before it.
+
+    Coordinates can be mapped in both directions:  forward from the original genome to the extracted genome, where
+    overlapping regions can map a base more than once, and in reverse, where every extracted base has exactly one
+    origin.  The map can be saved to a directory and loaded memory-mapped, see save and load_coordmap.
+    '''
+
+    def __init__(self):
+        self.chrs = []
+        self.starts = {}
+        self.ends = {}
+        self.ends_max = {}
+        self.offsets = {}
+        self.qends = {}
+
+    def add(self, chr, starts, ends):
+        '''
+        Add the regions of a chromosome, in extraction order, which is sorted by start
+        :param starts: array of 0-based region starts
+        :param ends: array of 0-based exclusive region ends
+        '''
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        offsets = np.zeros(len(starts), dtype=np.int64)
+        if len(starts) > 1:
+            np.cumsum(ends[:-1] - starts[:-1], out=offsets[1:])
+        self.set_arrays(chr, starts, ends, np.maximum.accumulate(ends) if len(ends) > 0 else ends, offsets)
+
+    def set_arrays(self, chr, starts, ends, ends_max, offsets):
+        if chr not in self.starts:
+            self.chrs.append(chr)
+        self.starts[chr] = starts
+        self.ends[chr] = ends
+        self.ends_max[chr] = ends_max
+        self.offsets[chr] = offsets
+        self.qends.pop(chr, None)
+
+    def size(self, chr):
+        '''
+        Return the size of chr in the extracted genome
+        '''
+        starts = self.starts[chr]
+        return int(self.offsets[chr][-1] + self.ends[chr][-1] - starts[-1]) if len(starts) > 0 else 0
+
+    def chain(self, chr, tSize, id=1):
+        '''
+        Return a Chain mapping chr in the original genome (target) to chr in the extracted genome (query)
+        :param tSize: size of chr in the original genome
+        '''
+        starts = self.starts[chr]
+        tStart = int(starts[0]) if len(starts) > 0 else 0
+        qSize = self.size(chr)
+        chain = Chain(chr, tSize, tStart, tSize, chr, qSize, 0, qSize, id)
+        chain.set_blocks(starts, self.offsets[chr], self.ends[chr] - starts)
+        return chain
+
+    def liftover(self, sizes):
+        '''
+        Return a Liftover from the original genome to the extracted genome
+        :param sizes: function returning the size of a chromosome in the original genome
+        '''
+        return Liftover([self.chain(chr, sizes(chr), i + 1) for i, chr in enumerate(self.chrs)])
+
+    def write_chain(self, path, sizes):
+        '''
+        Write the map as a UCSC chain file.  Chromosomes with nothing extracted are left out, as they are from the
+        fasta.
+        :param sizes: function returning the size of a chromosome in the original genome
+        '''
+        with open(path, "w") as o:
+            id = 0
+            for chr in self.chrs:
+                if self.size(chr) > 0:
+                    id += 1
+                    self.write_chain_entry(o, chr, sizes(chr), id)
+
+    def write_chain_entry(self, o, chr, size, id):
+        '''
+        Write the chain of a chromosome with at least one base extracted
+        :param o: output text stream
+        :param size: size of chr in the original genome
+        '''
+        starts = self.starts[chr]
+        ends = self.ends[chr]
+        qsize = self.size(chr)
+        tstart = int(starts[0])
+        tsize = size - tstart
+        o.write(f"chain 1000 {chr} {tsize} + {tstart} {tsize} {chr} {qsize} + 0 {qsize} {id}\n")
+
+        # size dt dq
+        block_sizes = (ends - starts).tolist()
+        gaps = (starts[1:] - ends[:-1]).tolist()
+        o.write(''.join(f"{size} {gap} 0\n" for size, gap in zip(block_sizes, gaps)))
+        o.write(f"{block_sizes[-1]}\n\n")
+
+    def forward(self, chr, starts, ends):
+        '''
+        Map intervals on chr in the original genome to the extracted genome.  An interval spanning several regions
+        maps to a piece in each, and bases in overlapping regions map once per region.
+        :param starts: array of 0-based interval starts
+        :param ends: array of 0-based exclusive interval ends
+        :return: tuple of arrays (rows, starts, ends), rows holds the index of the input interval of each piece
+        '''
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if chr not in self.starts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        rstarts, rends = self.starts[chr], self.ends[chr]
+        rows, blocks = overlapping_blocks(rstarts, rends, self.ends_max[chr], starts, ends)
+        mstarts, mends = project(rstarts[blocks], rends[blocks], self.offsets[chr][blocks], starts[rows], ends[rows])
+        return rows, mstarts, mends
+
+    def forward_positions(self, chr, positions):
+        '''
+        Map 0-based positions on chr in the original genome to the extracted genome
+        :return: tuple of arrays (rows, positions), positions outside all regions have no rows
+        '''
+        positions = np.asarray(positions, dtype=np.int64)
+        rows, mstarts, _ = self.forward(chr, positions, positions + 1)
+        return rows, mstarts
+
+    def reverse(self, chr, starts, ends):
+        '''
+        Map intervals on chr in the extracted genome back to the original genome.  An interval spanning several
+        regions maps to a piece in each.
+        :return: tuple of arrays (rows, starts, ends), rows holds the index of the input interval of each piece
+        '''
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if chr not in self.starts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        offsets, qends = self.offsets[chr], self.query_ends(chr)
+        # Regions are contiguous in the extracted genome, so their ends are already sorted
+        rows, blocks = overlapping_blocks(offsets, qends, qends, starts, ends)
+        ostarts, oends = project(offsets[blocks], qends[blocks], self.starts[chr][blocks], starts[rows], ends[rows])
+        return rows, ostarts, oends
+
+    def reverse_positions(self, chr, positions):
+        '''
+        Map 0-based positions on chr in the extracted genome back to the original genome
+        :return: array of original positions, -1 for positions outside the extracted chromosome
+        '''
+        positions = np.asarray(positions, dtype=np.int64)
+        result = np.full(len(positions), -1, dtype=np.int64)
+        if chr not in self.starts or len(self.starts[chr]) == 0:
+            return result
+        offsets = self.offsets[chr]
+        idx = np.searchsorted(offsets, positions, side='right') - 1
+        valid = (positions >= 0) & (positions < self.size(chr))
+        idx = idx[valid]
+        result[valid] = self.starts[chr][idx] + positions[valid] - offsets[idx]
+        return result
+
+    def query_ends(self, chr):
+        '''
+        Ends of the regions of chr in the extracted genome, computed on first use
+        '''
+        if chr not in self.qends:
+            self.qends[chr] = self.offsets[chr] + (self.ends[chr] - self.starts[chr])
+        return self.qends[chr]
+
+    def save(self, index_dir):
+        '''
+        Save the map as a directory of ".npy" arrays, memory-mapped by load_coordmap, and a json table of each
+        chromosome's offset into them
+        '''
+        os.makedirs(index_dir, exist_ok=True)
+        chromosomes = {}
+        offset = 0
+        for chr in self.chrs:
+            n = len(self.starts[chr])
+            chromosomes[chr] = [offset, n]
+            offset += n
+
+        arrays = {"starts": self.starts, "ends": self.ends, "endsMax": self.ends_max, "offsets": self.offsets}
+        for name, values in arrays.items():
+            a = [values[chr] for chr in self.chrs]
+            np.save(os.path.join(index_dir, f"{name}.npy"),
+                    np.concatenate(a).astype(np.int64) if len(a) > 0 else np.empty(0, dtype=np.int64))
+
+        with open(os.path.join(index_dir, "index.json"), "w") as f:
+            json.dump({"version": COORDS_VERSION, "chromosomes": chromosomes}, f)
+
+
+def load_coordmap(index_dir):
+    '''
+    Load a coordinate map saved with CoordinateMap.save.  Arrays are memory-mapped, so loading cost is independent
+    of the number of regions.
+    '''
+    with open(os.path.join(index_dir, "index.json")) as f:
+        index = json.load(f)
+    if index.get("version") != COORDS_VERSION:
+        raise ValueError(f"Unsupported coordinate index version: {index_dir}")
+
+    arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r') for name in COORDS_ARRAYS}
+    coordmap = CoordinateMap()
+    for chr, (offset, n) in index["chromosomes"].items():
+        s = slice(offset, offset + n)
+        coordmap.set_arrays(chr, arrays["starts"][s], arrays["ends"][s], arrays["endsMax"][s], arrays["offsets"][s])
+    return coordmap
+
+
+def coordmap_from_chain(chains_file):
+    '''
+    Rebuild the coordinate map of an existing extracted genome from its chain file
+    '''
+    coordmap = CoordinateMap()
+    for chain in load_liftover(chains_file).chains:
+        if chain.qName != chain.tName or chain.qStrand != '+':
+            raise ValueError(f"Not an extracted genome chain: {chain.tName} -> {chain.qName} ({chains_file})")
+        starts = np.asarray(chain.tStarts, dtype=np.int64)
+        ends = np.asarray(chain.tEnds, dtype=np.int64)
+        coordmap.set_arrays(chain.tName, starts, ends, np.asarray(chain.tEndsMax, dtype=np.int64),
+                            np.asarray(chain.qStarts, dtype=np.int64))
+    return coordmap
+
+
+def parse_query(query):
+    '''
+    Parse a query "chr:position" (1-based) or "chr:start-end" (1-based, inclusive)
+    :return: tuple (chr, 0-based start, 0-based exclusive end, is_point)
+    '''
+    region = regions.parse_region(query)
+    return region["chr"], region["start"] - 1, region["end"], '-' not in query.split(':')[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Map coordinates between an original and an extracted genome")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build a coordinate index from an extracted genome's chain file")
+    build_parser.add_argument("chain", help="chain file written by extractome")
+    build_parser.add_argument("index", help="output index directory")
+
+    query_parser = subparsers.add_parser("query", help="map positions (chr:pos) or intervals (chr:start-end)")
+    query_parser.add_argument("index", help="index directory, or chain file")
+    query_parser.add_argument("queries", nargs="*", help="1-based queries, read from stdin, one per line, if none are given")
+    query_parser.add_argument("--reverse", action="store_true", help="map from the extracted genome to the original genome")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        coordmap_from_chain(args.chain).save(args.index)
+        return
+
+    coordmap = load_coordmap(args.index) if os.path.isdir(args.index) else coordmap_from_chain(args.index)
+    queries = args.queries or [line.strip() for line in sys.stdin if line.strip()]
+    for query in queries:
+        chr, start, end, point = parse_query(query)
+        if args.reverse:
+            rows, mstarts, mends = coordmap.reverse(chr, [start], [end])
+        else:
+            rows, mstarts, mends = coordmap.forward(chr, [start], [end])
+        if len(rows) == 0:
+            print(f"{query}\tunmapped")
+        for s, e in zip(mstarts.tolist(), mends.tolist()):
+            print(f"{query}\t{chr}:{s + 1}" if point else f"{query}\t{chr}:{s + 1}-{e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,122 +1,447 @@
 import os
 import argparse
-import pysam
 import json
-from extractome.fasta import FastaReader
+import shutil
+import sys
+import tempfile
+from multiprocessing import Pool
+from extractome.chralias import read_chromalias, resolve_aliases
+from extractome.fasta import BACKENDS, FastaWriter, LINE_WIDTH, open_fasta
+from extractome.feature import infer_format, iter_bed_chromosomes, parse_columns
 from extractome.genome import get_genome
-from extractome.feature import parse
-from extractome.liftover import load_liftover
+from extractome.gff import GFFFilter, parse_gff_columns
+from extractome.inputs import load_inputs
+from extractome.coordmap import CoordinateMap
+from extractome.extsort import external_sort_bed
+from extractome.metrics import Metrics, file_size
+from extractome.manifest import open_previous, region_hash, save_manifest, source_fingerprint
+from extractome.regions import merge_intervals, pad_intervals
+from extractome.stream import getstream
+from extractome.twobit import TwoBitWriter, is_twobit
+
+# Alternating colors of the rows of the regions bed file
+REGION_COLORS = ('100,200,100', '100,100,200')
+
 
 '''
-This is the main function for the application.
+This is the main function for the application.  An already open reference, a tuple (fasta_index, fasta_reader) as
+returned by open_reference, and its chromosome alias rows as returned by read_chromalias, can be supplied by long
+running callers such as the extraction server.
 '''
-def extract_genome(args):
+def extract_genome(args, reference=None, alias_rows=None):
+
+    metrics = Metrics(args.cprofile is not None)
+
+    if args.twobit and (args.bgzip or args.incremental):
+        raise ValueError("--twobit is not combined with --bgzip or --incremental")
 
     # Create output directory
     if not os.path.exists(args.output):
         os.mkdir(args.output)
 
-    # Read the region data (bed file)
-    region_dict = build_region_dict(parse(args.regions, 'bed'))
-    chrlist = list(region_dict.keys())
-    chrlist.sort()
+    if args.sorted or args.sort_memory is not None:
+        extract_sorted(args, metrics, reference, alias_rows)
+        report_metrics(metrics, args)
+        return metrics
 
-    # Check for optional genome argument.  If supplied an igv.js genome json definition is used in lieu of a fasta file
-    if args.genome is not None:
-        genome = get_genome(args.genome)
-        if args.fasta is None:
-            args.fasta = genome["fastaURL"]
+    # Read the region data (bed file) and open the reference concurrently.  If the optional genome argument is
+    # supplied an igv.js genome json definition is used in lieu of a fasta file
+    with metrics.stage("load inputs") as stage:
+        (fasta_index, fasta_reader), (columns,) = load_inputs([args.regions], lambda: reference or open_reference(args),
+                                                               lambda path: parse_regions(path, args))
+        region_dict = build_region_columns(columns)
+        chrlist = list(region_dict.keys())
+        chrlist.sort()
+        if alias_rows is None and args.chrom_alias:
+            alias_rows = read_chromalias(args.chrom_alias)
+        aliases = resolve_chromosomes(chrlist, fasta_reader, alias_rows)
+        stage.bytes_read = file_size(args.regions)
+        stage.regions = sum(len(c) for c in region_dict.values())
 
     '''
-    Create fasta
+    Normalize regions (pad and merge), and map each to its offset in the extracted genome
     '''
-    fasta_reader = FastaReader(args.fasta)
-    fasta_file = os.path.join(args.output, f"{args.name}.fa")
-    with open(fasta_file, "w") as o:
-        for chr in chrlist:
-            o.write(f">{chr}\n")
-            regions = region_dict[chr]
-            for r in regions:
-                seq = fasta_reader.slice({"chr": chr, "start": r.start + 1, "end": r.end})
-                o.write(seq)
-            o.write("\n")
+    with metrics.stage("normalize regions") as stage:
+        coordmap = build_coordmap(region_dict, chrlist, fasta_reader, args.pad, merge_gap(args))
+        stage.regions = sum(len(coordmap.starts[chr]) for chr in chrlist)
 
     '''
-    Index fasta
+    Create fasta.  With --incremental, records of chromosomes whose regions are unchanged since the previous run
+    are copied from the previous output rather than extracted again, and a manifest of region hashes is saved for
+    the next run.  If the extraction fails the previous output is restored.
     '''
-    pysam.faidx(fasta_file)
+    with metrics.stage("write fasta", hot=True) as stage:
+        fasta_name = output_fasta_name(args)
+        fasta_file = os.path.join(args.output, fasta_name)
+        manifest_file = os.path.join(args.output, f"{args.name}.manifest.json")
+        previous = None
+        if args.incremental:
+            settings = {
+                "source": source_fingerprint(args.fasta, fasta_reader.sizes),
+                "fasta": fasta_name,
+                "line_width": args.line_width
+            }
+            hashes = {chr: region_hash(coordmap.starts[chr], coordmap.ends[chr],
+                                       aliases[chr] if aliases[chr] != chr else None) for chr in chrlist}
+            previous = open_previous(manifest_file, fasta_file, settings, hashes, args.bgzip)
 
-    ''' 
+        # A manifest left from an earlier run would no longer describe the fasta
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+
+        try:
+            with open_writer(fasta_file, args) as writer:
+                write_fasta(writer, fasta_reader, (args.fasta, fasta_index, args.cache_dir, args.fasta_backend, aliases),
+                            coordmap, args.threads, args.output, previous)
+        except BaseException:
+            if previous is not None:
+                previous.restore()
+            raise
+        if previous is not None:
+            previous.close()
+        if args.incremental:
+            save_manifest(manifest_file, settings, hashes)
+        stage.bytes_read = sum(coordmap.size(chr) for chr in chrlist)
+        stage.bytes_written = file_size(fasta_file)
+        stage.regions = sum(len(coordmap.starts[chr]) for chr in chrlist)
+
+    '''
     Create .chain file
     '''
-    chromsizes = {}
-    for chr in chrlist:
-        regions = region_dict[chr]
-        size = 0;
-        for r in regions:
-            size += r.end - r.start
-        chromsizes[chr] = size
+    with metrics.stage("write chain", hot=True) as stage:
+        chains_file = os.path.join(args.output, f"{args.name}.chain")
+        coordmap.write_chain(chains_file, fasta_reader.size)
+        stage.bytes_written = file_size(chains_file)
 
-    chains_file = os.path.join(args.output, f"{args.name}.chain")
-    with open(chains_file, "w") as o:
-        id = 0
-        for chr in chrlist:
-            id += 1
-            regions = region_dict[chr]
-            qstart = 0
-            qsize = chromsizes[chr]
-            tstart = regions[0].start
-            tsize = fasta_reader.size(chr) - tstart
-            o.write(f"chain 1000 {chr} {tsize} + {tstart} {tsize} {chr} {qsize} + {qstart} {chromsizes[chr]} {id}\n")
-
-            for i in range(len(regions) - 1):
-                # size dt dq
-                r = regions[i]
-                rnext = regions[i + 1]
-                o.write(f"{r.size()} {rnext.start - r.end} {0}\n")
-            o.write(f"{rnext.size()}\n\n")
+    # Coordinate index for two-way lookups (optional)
+    if args.coords_index:
+        with metrics.stage("write coordinate index"):
+            coordmap.save(os.path.join(args.output, f"{args.name}.coords"))
 
     '''
     Create bed file for marking regions -- alternating colors
     '''
+    with metrics.stage("liftover regions", hot=True) as stage:
+        liftover = coordmap.liftover(fasta_reader.size)
+        regions_file = os.path.join(args.output, f"{args.name}.regions.bed")
+        write_regions_bed(regions_file, region_dict, chrlist, liftover)
+        stage.bytes_written = file_size(regions_file)
+        stage.regions = sum(len(c) for c in region_dict.values())
 
-    liftover = load_liftover(chains_file)
-    color1 = '100,200,100'
-    color2 = '100,100,200'
-    color = color1
+    '''
+    Create genome json file (optional)
+    '''
+    with metrics.stage("write json") as stage:
+        json_file = os.path.join(args.output, f"{args.name}.json")
+        write_genome_json(json_file, args.name, fasta_name, args.bgzip)
+        stage.bytes_written = file_size(json_file)
+
+    report_metrics(metrics, args)
+    return metrics
+
+
+def extract_sorted(args, metrics, reference=None, alias_rows=None):
+    '''
+    Chromosome-at-a-time pipeline for coordinate sorted bed files (--sorted).  Each chromosome's regions are read,
+    normalized, and written to the fasta, chain, and regions files before the next chromosome is read, so memory use
+    is bounded by the largest chromosome's regions.  Chromosomes are written in input order:  for input sorted with
+    "sort -k1,1 -k2,2n" the output is identical to that of the default pipeline.
+
+    With --sort-memory unsorted input is first sorted out of core by extsort.external_sort_bed, which streams the
+    chromosomes in the order of the default pipeline.
+    '''
+    if args.incremental or args.coords_index or region_format(args.regions, args) != 'bed':
+        raise ValueError("--sorted and --sort-memory support bed regions only, without --incremental or --coords-index")
+
+    with metrics.stage("open reference"):
+        _, fasta_reader = reference or open_reference(args)
+        if alias_rows is None and args.chrom_alias:
+            alias_rows = read_chromalias(args.chrom_alias)
 
+    fasta_name = output_fasta_name(args)
+    fasta_file = os.path.join(args.output, fasta_name)
+    chains_file = os.path.join(args.output, f"{args.name}.chain")
     regions_file = os.path.join(args.output, f"{args.name}.regions.bed")
-    with open(regions_file, "w") as o:
+
+    with metrics.stage("stream regions", hot=True) as stage:
+        aliases = {}
+        color = REGION_COLORS[0]
+        stage.regions = id = 0
+        if args.sort_memory is not None:
+            chromosomes = external_sort_bed(args.regions, args.sort_memory << 20, tmp_root=args.output)
+        else:
+            chromosomes = read_sorted_bed(args.regions)
+        with open_writer(fasta_file, args) as writer, \
+                open(chains_file, "w") as chains_out, open(regions_file, "w") as regions_out:
+            for columns in chromosomes:
+                chr = columns.chr
+                resolved, unresolved = resolve_aliases([chr], fasta_reader.sizes.keys(), alias_rows)
+                if len(unresolved) > 0:
+                    raise ValueError(f"Chromosomes not found in the fasta: {chr}")
+                aliases.update(resolved)
+                fasta_reader.set_aliases(aliases)
+
+                coordmap = build_coordmap({chr: columns}, [chr], fasta_reader, args.pad, args.merge_gap)
+                write_record(writer, fasta_reader, chr, coordmap.starts[chr], coordmap.ends[chr])
+                if coordmap.size(chr) > 0:
+                    id += 1
+                    coordmap.write_chain_entry(chains_out, chr, fasta_reader.size(chr), id)
+                color = write_region_rows(regions_out, columns, coordmap.liftover(fasta_reader.size), color)
+                stage.regions += len(columns)
+        stage.bytes_read = file_size(args.regions)
+        stage.bytes_written = file_size(fasta_file)
+
+    with metrics.stage("write json") as stage:
+        json_file = os.path.join(args.output, f"{args.name}.json")
+        write_genome_json(json_file, args.name, fasta_name, args.bgzip)
+        stage.bytes_written = file_size(json_file)
+
+
+def read_sorted_bed(path):
+    with getstream(path) as f:
+        yield from iter_bed_chromosomes(f)
+
+
+def report_metrics(metrics, args):
+    '''
+    Print the metrics summary with --profile, and save the metrics and cProfile statistics if requested
+    '''
+    if args.profile:
+        print(metrics.summary(), file=sys.stderr)
+    if args.metrics_out is not None:
+        metrics.save(args.metrics_out)
+    if args.cprofile is not None:
+        metrics.save_profile(args.cprofile)
+
+
+def resolve_fasta(args):
+    '''
+    Resolve the reference fasta.  If args.fasta is not set it is taken from the igv.js definition of args.genome,
+    along with its chromosome alias file unless args.chrom_alias is set.
+    :return: the location of the fasta index, if it is not args.fasta + ".fai"
+    '''
+    fasta_index = None
+    if args.genome is not None:
+        genome = get_genome(args.genome, cache_dir=args.cache_dir, offline=args.offline)
+        if args.fasta is None:
+            args.fasta = genome.get("fastaURL") or genome.get("twoBitURL")
+            fasta_index = genome.get("indexURL")
+            if args.chrom_alias is None:
+                args.chrom_alias = genome.get("chromAliasURL")
+    return fasta_index
+
+
+def output_fasta_name(args):
+    if args.twobit:
+        return f"{args.name}.2bit"
+    return f"{args.name}.fa.gz" if args.bgzip else f"{args.name}.fa"
+
+
+def open_writer(path, args):
+    '''
+    Writer for the extracted sequence, a .2bit file with --twobit, else fasta
+    '''
+    if args.twobit:
+        return TwoBitWriter(path, args.line_width)
+    return FastaWriter(path, args.line_width, args.bgzip, args.threads)
+
+
+def region_format(path, args):
+    '''
+    Format of a regions file, bed or gff, from args.format or else the file name
+    '''
+    format = args.format or infer_format(path)
+    return 'gff' if format in ('gff', 'gff3', 'gtf') else 'bed'
+
+
+def parse_regions(path, args):
+    '''
+    Parse a regions file into columns.  Bed files give one region per line, gff/gtf annotations are streamed through
+    the type and attribute filters of args and merged as they are read, see gff.parse_gff_columns.
+    '''
+    if region_format(path, args) == 'bed':
+        return parse_columns(path)
+    attributes = {}
+    for a in args.attribute or []:
+        key, sep, value = a.partition('=')
+        if not sep:
+            raise ValueError(f"Expected KEY=VALUE: {a}")
+        attributes.setdefault(key, []).append(value)
+    types = [t for ts in args.feature_type or [] for t in ts.split(',')]
+    gtf = args.format == 'gtf' if args.format else None
+    return parse_gff_columns(path, GFFFilter(types, attributes), gtf)
+
+
+def merge_gap(args):
+    '''
+    Overlapping annotation features are always merged, bed regions only if args.merge_gap is set
+    '''
+    if args.merge_gap is None and region_format(args.regions, args) == 'gff':
+        return 0
+    return args.merge_gap
+
+
+def open_reference(args):
+    '''
+    Resolve and open the reference fasta
+    :return: tuple (fasta_index, fasta_reader)
+    '''
+    fasta_index = resolve_fasta(args)
+    return fasta_index, open_fasta(args.fasta, fasta_index, args.cache_dir, args.fasta_backend)
+
+
+def resolve_chromosomes(chrlist, fasta_reader, alias_rows=None):
+    '''
+    Resolve the regions' chromosome names to fasta sequence names once, before anything is extracted, so the
+    reader looks each one up directly.
+    :param alias_rows: optional chromosome alias rows, as returned by read_chromalias
+    :return: dictionary of region chromosome name -> fasta sequence name
+    '''
+    aliases, unresolved = resolve_aliases(chrlist, fasta_reader.sizes.keys(), alias_rows)
+    if len(unresolved) > 0:
+        raise ValueError(f"Chromosomes not found in the fasta: {', '.join(unresolved)}")
+    fasta_reader.set_aliases(aliases)
+    return aliases
+
+
+def build_coordmap(region_dict, chrlist, fasta_reader, pad=0, merge_gap=None):
+    '''
+    Normalize regions (pad and merge), and map each to its offset in the extracted genome
+    '''
+    coordmap = CoordinateMap()
+    for chr in chrlist:
+        starts, ends = region_dict[chr].starts, region_dict[chr].ends
+        if pad:
+            starts, ends = pad_intervals(starts, ends, pad, fasta_reader.size(chr))
+        if merge_gap is not None:
+            starts, ends = merge_intervals(starts, ends, merge_gap)
+        coordmap.add(chr, starts, ends)
+    return coordmap
+
+
+def write_regions_bed(path, region_dict, chrlist, liftover):
+    '''
+    Write the input regions lifted to the extracted genome, in alternating colors
+    '''
+    color = REGION_COLORS[0]
+    with open(path, "w") as o:
         for chr in chrlist:
-            regions = region_dict[chr]
-            for r in regions:
-                liftovers = liftover.map(r)
-                for f in liftovers:
-                    f.setcolor(color)
-                    o.write(f.tostring() + "\n")
-                    color = color1 if color is color2 else color2
+            color = write_region_rows(o, region_dict[chr], liftover, color)
 
+
+def write_region_rows(o, columns, liftover, color):
     '''
-    Create genome json file (optional)
+    Write the lifted regions of one chromosome to the regions bed file
+    :param color: color of the first row
+    :return: color of the next row
+    '''
+    color1, color2 = REGION_COLORS
+    for mapped in liftover.map_columns(columns).values():
+        mchr = mapped.chr
+        for start, end, name, score in zip(mapped.starts.tolist(), mapped.ends.tolist(), mapped.names, mapped.scores):
+            o.write(f"{mchr}\t{start}\t{end}\t{name}\t{score}\t+\t{start}\t{end}\t{color}\n")
+            color = color1 if color is color2 else color2
+    return color
+
+
+def write_genome_json(path, name, fasta_name, bgzip=False):
+    '''
+    Write an igv.js genome definition for the extracted genome.  A .2bit sequence file needs no index.
     '''
     genome = {
-        "id": args.name,
-        "name": args.name,
-        "fastaURL": f"{args.name}.fa",
-        "fastaIndex": f"{args.name}.fa.fai",
-        "tracks": [
-            {
-                "name": "regions",
-                "url": f"{args.name}.regions.bed"
-            }
-        ]
+        "id": name,
+        "name": name
     }
+    if is_twobit(fasta_name):
+        genome["twoBitURL"] = fasta_name
+    else:
+        genome["fastaURL"] = fasta_name
+        genome["fastaIndex"] = f"{fasta_name}.fai"
+    if bgzip:
+        genome["compressedIndexURL"] = f"{fasta_name}.gzi"
+    genome["tracks"] = [
+        {
+            "name": "regions",
+            "url": f"{name}.regions.bed"
+        }
+    ]
 
-    json_file = os.path.join(args.output, f"{args.name}.json")
-    with open(json_file, "w") as f:
+    with open(path, "w") as f:
         print(json.dumps(genome, indent=4), file=f)
 
 
+def write_record(writer, fasta_reader, chr, starts, ends):
+    '''
+    Write the extracted sequence for one chromosome.  Regions are streamed from the reader in bounded chunks,
+    the writer indexes the record as it goes.
+    '''
+    fasta_reader.prefetch(chr, starts, ends)
+    writer.begin(chr)
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        for seq in fasta_reader.chunks(chr, start, end):
+            writer.write(seq)
+    writer.end()
+
+
+def write_fasta(writer, fasta_reader, fasta, coordmap, threads, tmp_root, previous=None):
+    '''
+    Write a record for each chromosome of the coordinate map.  Records that can be reused are copied from the
+    previous output, the others are extracted, in a pool of worker processes if threads > 1.
+    :param fasta: tuple (fasta, fasta_index, cache_dir, backend, aliases) used by worker processes to open their own
+        reader
+    '''
+    reusable = previous.reusable if previous is not None else set()
+    extract = [chr for chr in coordmap.chrs if chr not in reusable]
+
+    tmpdir = tempfile.mkdtemp(dir=tmp_root) if threads > 1 and len(extract) > 1 else None
+    try:
+        parts = write_parts(fasta, coordmap, extract, threads, tmpdir, writer.line_width) if tmpdir is not None else {}
+        for chr in coordmap.chrs:
+            if chr in parts:
+                writer.append(*parts[chr])
+            elif chr in reusable:
+                previous.copy_record(writer, chr)
+            else:
+                write_record(writer, fasta_reader, chr, coordmap.starts[chr], coordmap.ends[chr])
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def write_parts(fasta, coordmap, chrlist, threads, tmpdir, line_width):
+    '''
+    Extract chromosomes in a pool of worker processes.  Each worker opens its own reader and writes whole
+    records to a part file in tmpdir.  Appending the parts in chromosome order gives output byte-identical
+    to a serial run.
+    :return: dictionary of chromosome name -> (part file, fai rows)
+    '''
+    # Largest chromosomes first for better load balancing
+    work = [(chr, coordmap.starts[chr], coordmap.ends[chr], os.path.join(tmpdir, f"{i}.fa"), line_width)
+            for i, chr in enumerate(chrlist)]
+    work.sort(key=lambda w: -coordmap.size(w[0]))
+
+    parts = {}
+    with Pool(threads, initializer=_init_worker, initargs=fasta) as pool:
+        for chr, part_file, index in pool.imap_unordered(_write_part, work):
+            parts[chr] = (part_file, index)
+    return parts
+
+
+_worker_reader = None
+
+
+def _init_worker(fasta, fasta_index, cache_dir, backend, aliases):
+    global _worker_reader
+    _worker_reader = open_fasta(fasta, fasta_index, cache_dir, backend)
+    _worker_reader.set_aliases(aliases)
+
+
+def _write_part(work):
+    chr, starts, ends, part_file, line_width = work
+    writer = FastaWriter(part_file, line_width)
+    write_record(writer, _worker_reader, chr, starts, ends)
+    writer.close()
+    return chr, part_file, writer.index
 
 
 def build_region_dict(region_list):
@@ -132,15 +457,85 @@ def build_region_dict(region_list):
     return dict
 
 
-def main():
+def build_region_columns(columns):
+    '''
+    Columnar equivalent of build_region_dict
+    :param columns: dictionary of chromosome name -> FeatureColumns, see feature.parse_columns
+    '''
+    return {chr: c.sort() for chr, c in columns.items()}
+
+
+def non_negative_int(value):
+    '''
+    argparse type for counts of bases, e.g. --pad and --merge-gap
+    '''
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if n < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return n
+
+
+def positive_int(value):
+    '''
+    argparse type for sizes that must be at least 1, e.g. --line-width
+    '''
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be positive: {value}")
+    return n
+
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser()
-    parser.add_argument("regions", help="bed file defining regions, required")
+    parser.add_argument("regions", help="bed, gff3, or gtf file defining regions, required")
+    parser.add_argument("--format", choices=["bed", "gff", "gtf"], default=None,
+                        help="format of the regions file, inferred from the file name by default")
+    parser.add_argument("--feature-type", action="append", default=None,
+                        help="gff/gtf feature types to extract, e.g. exon or exon,CDS, may be repeated.  Default all")
+    parser.add_argument("--attribute", action="append", default=None, metavar="KEY=VALUE",
+                        help="keep gff/gtf features with this attribute value, e.g. gene_type=protein_coding, may be repeated")
     parser.add_argument("--fasta", default=None, help="reference fasta file, required if --genome is not specified")
     parser.add_argument("--genome", help="igv.js genome id (e.g. hg38)")
+    parser.add_argument("--chrom-alias", default=None,
+                        help="chromosome alias file (igv.js chromAlias format) mapping region chromosome names to fasta names")
+    parser.add_argument("--fasta-backend", choices=BACKENDS, default="pysam",
+                        help="reader for local fasta files, mmap requires an uncompressed fasta with a .fai index")
+    parser.add_argument("--cache-dir", default=None, help="directory for the cached genome catalog, default ~/.cache/extractome")
+    parser.add_argument("--offline", action="store_true", help="resolve --genome from the cached catalog only")
     parser.add_argument("--name", help="xome name", default="Xome")
     parser.add_argument("--output", help="output directory name", default="output")
-    args = parser.parse_args()
-    extract_genome(args)
+    parser.add_argument("--line-width", type=positive_int, default=LINE_WIDTH, help="bases per line in the output fasta")
+    parser.add_argument("--merge-gap", type=non_negative_int, default=None,
+                        help="merge regions separated by no more than this many bases, 0 merges overlapping and adjacent regions")
+    parser.add_argument("--pad", "--flank", type=non_negative_int, default=0, help="extend each region by this many bases on both sides")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="number of worker processes for fasta extraction, and threads for --bgzip compression")
+    parser.add_argument("--sorted", action="store_true",
+                        help="regions are sorted by chromosome and start, process them one chromosome at a time in bounded memory")
+    parser.add_argument("--sort-memory", type=positive_int, default=None, metavar="MB",
+                        help="sort unsorted bed regions out of core within this memory budget, in MB, and process them as with --sorted")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse fasta records of chromosomes whose regions are unchanged since the previous run")
+    parser.add_argument("--bgzip", action="store_true", help="write a block gzipped fasta with .fai and .gzi indexes")
+    parser.add_argument("--twobit", action="store_true", help="write the extracted sequence as a UCSC .2bit file instead of fasta")
+    parser.add_argument("--coords-index", action="store_true",
+                        help="save a coordinate index directory, base_name.coords, for extractome-coords")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time, bytes, regions, and peak memory of each stage to stderr")
+    parser.add_argument("--metrics-out", default=None, help="write the per-stage metrics to this json file")
+    parser.add_argument("--cprofile", default=None,
+                        help="run the extraction, chain, and liftover stages under cProfile and save the statistics to this file")
+    return parser.parse_args(argv)
+
+
+def main():
+    extract_genome(parse_args())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,280 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from extractome.feature import FeatureColumns, READ_SIZE
+from extractome.stream import getstream
+
+# Default memory budget of the sort, in bytes
+SORT_MEMORY = 1 << 30
+
+# Approximate memory used per region while a run is collected:  the numeric fields plus the Python strings of the
+# name and score columns
+BYTES_PER_REGION = 200
+
+# Compact fixed size record of a region in a sorted run.  seq is the input line number, which makes the sort stable.
+RECORD = np.dtype([('chr', np.int32), ('start', np.int64), ('end', np.int64), ('seq', np.int64)])
+
+# Most runs merged at once, more are first merged in passes into longer runs.  Bounds the open files and the per
+# batch work of the merge.
+MERGE_FANIN = 64
+
+# Fewest records read from a run at a time while merging
+MIN_BATCH = 1024
+
+
+def external_sort_bed(path, memory=SORT_MEMORY, tmp_root=None, names=True, read_size=READ_SIZE):
+    '''
+    Sort a bed file of any size by chromosome and start within a fixed memory budget.  The file is read in runs that
+    fit the budget; each run is sorted and spilled to temporary files as compact binary records, with names and
+    scores in a companion text file.  The runs are then k-way merged in batches.  Ties keep their input order, so
+    the result matches the in-memory sort of the default pipeline.
+    :param memory: memory budget in bytes, at least BYTES_PER_REGION
+    :param tmp_root: directory for the temporary run files, default the system temporary directory
+    :return: generator of FeatureColumns, one per chromosome, in lexicographic chromosome order
+    '''
+    if memory < BYTES_PER_REGION:
+        raise ValueError(f"Sort memory budget of {memory} bytes is below the {BYTES_PER_REGION} bytes of one region")
+    run_size = memory // BYTES_PER_REGION
+    tmpdir = tempfile.mkdtemp(dir=tmp_root)
+    try:
+        chr_ids = {}
+        runs = []
+        with getstream(path) as f:
+            for records, run_names in read_runs(f, chr_ids, run_size, names, read_size):
+                order = sort_order(records, chr_ids)
+                if len(runs) == 0 and len(records) < run_size:
+                    # Everything fit in a single run, no need to spill
+                    yield from split_chromosomes(records[order], take_names(run_names, order), chr_ids)
+                    return
+                runs.append(spill_run(tmpdir, len(runs), records[order], take_names(run_names, order)))
+
+        if runs:
+            while len(runs) > MERGE_FANIN:
+                runs = [merge_to_run(tmpdir, f"pass{len(runs)}.{i}", runs[i:i + MERGE_FANIN], chr_ids,
+                                     merge_batch(run_size, MERGE_FANIN))
+                        for i in range(0, len(runs), MERGE_FANIN)]
+            yield from split_chromosomes_stream(merge_runs(runs, chr_ids, merge_batch(run_size, len(runs))), chr_ids)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def read_runs(f, chr_ids, run_size, names, read_size):
+    '''
+    Read the bed stream in runs of at most run_size regions
+    :return: generator of (records, names), names is a tuple of name and score lists, or None
+    '''
+    seq = 0
+    chrs, starts, ends = [], [], []
+    name_col, score_col = ([], []) if names else (None, None)
+    for lines in iter(lambda: f.readlines(read_size), []):
+        for line in lines:
+            if line.startswith('#') or line.startswith('track') or line.startswith('browser'):
+                continue
+            tokens = line.rstrip('\n').rstrip('\r').split('\t')
+            if len(tokens) < 3:
+                continue
+            id = chr_ids.get(tokens[0])
+            if id is None:
+                id = chr_ids[tokens[0]] = len(chr_ids)
+            chrs.append(id)
+            starts.append(tokens[1])
+            ends.append(tokens[2])
+            if names:
+                name_col.append(tokens[3] if len(tokens) > 3 else '')
+                score_col.append(tokens[4] if len(tokens) > 4 else None)
+            if len(chrs) == run_size:
+                yield to_records(chrs, starts, ends, seq), (name_col, score_col) if names else None
+                seq += len(chrs)
+                chrs, starts, ends = [], [], []
+                name_col, score_col = ([], []) if names else (None, None)
+    if chrs:
+        yield to_records(chrs, starts, ends, seq), (name_col, score_col) if names else None
+
+
+def to_records(chrs, starts, ends, seq):
+    records = np.empty(len(chrs), dtype=RECORD)
+    records['chr'] = chrs
+    records['start'] = np.array(starts).astype(np.int64)
+    records['end'] = np.array(ends).astype(np.int64)
+    records['seq'] = np.arange(seq, seq + len(chrs))
+    return records
+
+
+def chr_ranks(chr_ids):
+    '''
+    Rank of each chromosome id in lexicographic order of the names seen so far
+    '''
+    ranks = np.empty(len(chr_ids), dtype=np.int64)
+    for rank, name in enumerate(sorted(chr_ids)):
+        ranks[chr_ids[name]] = rank
+    return ranks
+
+
+def sort_order(records, chr_ids):
+    return np.lexsort((records['seq'], records['start'], chr_ranks(chr_ids)[records['chr']]))
+
+
+def take_names(run_names, order):
+    if run_names is None:
+        return None
+    name_col, score_col = run_names
+    return np.array(name_col, dtype=object)[order], np.array(score_col, dtype=object)[order]
+
+
+def spill_run(tmpdir, i, records, run_names):
+    '''
+    Write a sorted run:  binary records, and name / score lines if names are kept
+    :return: tuple (records file, names file or None, number of records)
+    '''
+    records_file = os.path.join(tmpdir, f"run{i}.bin")
+    records.tofile(records_file)
+    names_file = None
+    if run_names is not None:
+        names_file = os.path.join(tmpdir, f"run{i}.names")
+        with open(names_file, "w") as o:
+            write_names(o, *run_names)
+    return records_file, names_file, len(records)
+
+
+def merge_batch(run_size, fanin):
+    return max(MIN_BATCH, run_size // fanin)
+
+
+def merge_to_run(tmpdir, label, runs, chr_ids, batch):
+    '''
+    Merge a group of runs into a single longer run, removing the inputs
+    '''
+    records_file = os.path.join(tmpdir, f"{label}.bin")
+    names_file = os.path.join(tmpdir, f"{label}.names") if runs[0][1] is not None else None
+    count = 0
+    with open(records_file, "wb") as o:
+        no = open(names_file, "w") if names_file is not None else None
+        for records, names, scores in merge_runs(runs, chr_ids, batch):
+            records.tofile(o)
+            if no is not None:
+                write_names(no, names, scores)
+            count += len(records)
+        if no is not None:
+            no.close()
+    for run in runs:
+        for file in run[:2]:
+            if file is not None:
+                os.remove(file)
+    return records_file, names_file, count
+
+
+def write_names(o, names, scores):
+    # A missing score is written as a name without a tab
+    o.writelines(f"{n}\t{s}\n" if s is not None else f"{n}\n" for n, s in zip(names, scores))
+
+
+class RunReader:
+    '''
+    Reads a spilled run back in batches
+    '''
+
+    def __init__(self, run, batch):
+        records_file, names_file, self.count = run
+        self.records = np.memmap(records_file, dtype=RECORD, mode='r', shape=(self.count,)) if self.count > 0 else None
+        self.names = open(names_file) if names_file is not None else None
+        self.batch = batch
+        self.position = 0
+
+    def read(self):
+        '''
+        :return: tuple (records, names, scores) of the next batch, or None at the end of the run
+        '''
+        if self.position >= self.count:
+            if self.names is not None:
+                self.names.close()
+            return None
+        end = min(self.position + self.batch, self.count)
+        records = np.array(self.records[self.position:end])
+        names = scores = None
+        if self.names is not None:
+            lines = [self.names.readline().rstrip('\n').split('\t', 1) for _ in range(end - self.position)]
+            names = np.array([t[0] for t in lines], dtype=object)
+            scores = np.array([t[1] if len(t) > 1 else None for t in lines], dtype=object)
+        self.position = end
+        return records, names, scores
+
+
+def merge_runs(runs, chr_ids, batch):
+    '''
+    k-way merge of sorted runs, in batches.  Buffered records up to the smallest of the runs' last buffered keys
+    are sorted and emitted together, so at most one batch per run is held in memory.
+    :return: generator of (records, names, scores) batches in sorted order
+    '''
+    ranks = chr_ranks(chr_ids)
+    readers = [RunReader(run, batch) for run in runs]
+    buffers = [r.read() for r in readers]
+
+    while True:
+        live = [i for i, b in enumerate(buffers) if b is not None]
+        if not live:
+            return
+
+        # The smallest last key:  every record at or below it is in the buffers
+        keys = [(int(ranks[buffers[i][0]['chr'][-1]]), int(buffers[i][0]['start'][-1]), int(buffers[i][0]['seq'][-1]))
+                for i in live]
+        limit = min(keys)
+
+        parts = []
+        for i in live:
+            records, names, scores = buffers[i]
+            rank = ranks[records['chr']]
+            take = (rank < limit[0]) | ((rank == limit[0]) & ((records['start'] < limit[1]) |
+                                                              ((records['start'] == limit[1]) & (records['seq'] <= limit[2]))))
+            n = int(np.count_nonzero(take))   # records are sorted, so take is a prefix
+            parts.append((records[:n], names[:n] if names is not None else None, scores[:n] if scores is not None else None))
+            if n == len(records):
+                buffers[i] = readers[i].read()
+            else:
+                buffers[i] = (records[n:], names[n:] if names is not None else None, scores[n:] if scores is not None else None)
+
+        records = np.concatenate([p[0] for p in parts])
+        order = np.lexsort((records['seq'], records['start'], ranks[records['chr']]))
+        if parts[0][1] is not None:
+            yield records[order], np.concatenate([p[1] for p in parts])[order], np.concatenate([p[2] for p in parts])[order]
+        else:
+            yield records[order], None, None
+
+
+def split_chromosomes(records, run_names, chr_ids):
+    names, scores = run_names if run_names is not None else (None, None)
+    yield from split_chromosomes_stream([(records, names, scores)], chr_ids)
+
+
+def split_chromosomes_stream(batches, chr_ids):
+    '''
+    Group sorted batches into one FeatureColumns per chromosome
+    '''
+    id_names = {id: name for name, id in chr_ids.items()}
+    current = None
+    pending = []
+
+    def columns():
+        records = np.concatenate([p[0] for p in pending])
+        names = np.concatenate([p[1] for p in pending]) if pending[0][1] is not None else None
+        scores = np.concatenate([p[2] for p in pending]) if pending[0][2] is not None else None
+        return FeatureColumns(id_names[current], records['start'].copy(), records['end'].copy(), names, scores)
+
+    for records, names, scores in batches:
+        if len(records) == 0:
+            continue
+        chrs = records['chr']
+        bounds = np.flatnonzero(chrs[1:] != chrs[:-1]) + 1
+        for a, b in zip(np.concatenate(([0], bounds)).tolist(), np.append(bounds, len(records)).tolist()):
+            id = int(chrs[a])
+            if id != current:
+                if pending:
+                    yield columns()
+                current = id
+                pending = []
+            pending.append((records[a:b], names[a:b] if names is not None else None,
+                            scores[a:b] if scores is not None else None))
+    if pending:
+        yield columns()
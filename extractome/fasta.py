@@ -1,7 +1,19 @@
 from extractome import regions
+from extractome.bgzf import BgzfWriter
 from extractome.chralias import build_aliastable
+from extractome.stream import getstream
+import numpy as np
 import pysam
 
+# Default number of bases fetched from the reference per read when streaming a region
+CHUNK_SIZE = 1 << 20
+
+# Default number of bases per line in written fasta files (samtools convention)
+LINE_WIDTH = 60
+
+# Pieces with at least this many full lines are wrapped with a single numpy copy rather than line by line
+WRAP_MIN_LINES = 32
+
 def get_data(fasta_file,region=None):
 
     if None == region:
@@ -26,6 +38,52 @@ def get_data(fasta_file,region=None):
 
         return slice_seq
 
+def read_fai(path):
+    '''
+    Read a fasta index.
+    :return: Dictionary of sequence name -> (length, offset, linebases, linewidth), in file order
+    '''
+    index = {}
+    with getstream(path) as f:
+        for line in f:
+            tokens = line.rstrip('\n').rstrip('\r').split('\t')
+            if len(tokens) >= 5:
+                index[tokens[0]] = tuple(int(t) for t in tokens[1:5])
+    return index
+
+
+# Readers for local fasta files, selected with open_fasta's backend parameter
+BACKENDS = ["pysam", "mmap"]
+
+
+def open_fasta(path, index_url=None, cache_dir=None, backend=None):
+    '''
+    Open a reader for a fasta file.  Uncompressed remote files are read with coalesced, cached range requests,
+    local files are opened with pysam, or memory mapped with backend="mmap".  Local UCSC .2bit files are read
+    with twobit.TwoBitReader whatever the backend.
+    :param index_url: location of the ".fai" index if it is not path + ".fai"
+    :param cache_dir: base directory of the block cache for remote files
+    :param backend: reader for local files, one of BACKENDS, default pysam
+    '''
+    if path.lower().endswith(".2bit"):
+        if path.startswith("http://") or path.startswith("https://"):
+            raise ValueError(f"Remote 2bit files are not supported: {path}")
+        from extractome.twobit import TwoBitReader
+        return TwoBitReader(path)
+    if (path.startswith("http://") or path.startswith("https://")) and not path.endswith(".gz"):
+        from extractome.genome import CACHE_DIR
+        from extractome.remotefasta import RemoteFastaReader
+        return RemoteFastaReader(path, index_url, cache_dir or CACHE_DIR)
+    if backend == "mmap":
+        if path.endswith(".gz") or path.startswith("http://") or path.startswith("https://"):
+            raise ValueError(f"The mmap backend requires a local uncompressed fasta: {path}")
+        from extractome.mmapfasta import MmapFastaReader
+        return MmapFastaReader(path, index_url)
+    if backend not in (None, "pysam"):
+        raise ValueError(f"Unknown fasta backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return FastaReader(path)
+
+
 class FastaReader:
 
     def __init__(self, path):
@@ -53,19 +111,32 @@ class FastaReader:
             if isinstance(region,str):
                 region = regions.parse_region(region)
 
-            chr = region["chr"]
+            chr = self.chrname(region["chr"])
             start = region["start"] - 1
             end = region["end"]
 
-            try:
-                seq = self.fasta.fetch(chr, start, end)
+            return self.fasta.fetch(chr, start, end)
 
+    def prefetch(self, chr, starts, ends):
+        '''
+        Hint that the given regions are about to be read.  Nothing to do for local files.
+        '''
+        pass
 
-            except KeyError:
-                chr = "chr" + chr
-                seq = self.fasta.fetch(chr, start, end)
+    def chunks(self, chr, start, end, chunk_size=CHUNK_SIZE):
+        '''
+        Generator yielding the sequence of chr:start-end in pieces of at most chunk_size bases
+        :param start: 0-based start, inclusive
+        :param end: 0-based end, exclusive
+        '''
+        for s in range(start, end, chunk_size):
+            yield self.slice({"chr": chr, "start": s + 1, "end": min(s + chunk_size, end)})
 
-            return seq
+    def set_aliases(self, aliases):
+        '''
+        Replace the alias table with chromosome names resolved up front, see chralias.resolve_aliases
+        '''
+        self.aliastable = aliases
 
     def chrname(self, chr):
         return self.aliastable[chr] if chr in self.aliastable else chr
@@ -74,3 +145,141 @@ class FastaReader:
         return self.sizes[self.chrname(chr)]
 
 
+class FastaWriter:
+    '''
+    Writes a line-wrapped fasta file record by record, building the ".fai" index as it goes.  Sequence can be
+    supplied in pieces of any size (str, bytes, or memoryview), so memory use is independent of record size.
+    With bgzip=True the file is block gzipped, compressed with the given number of threads, and a ".gzi" index
+    is written as well.  Empty records are left out of both the fasta and the index, as samtools faidx would not
+    index them.
+
+    Usage:  writer.begin(name); writer.write(seq) ...; writer.end(); ...; writer.close()
+    '''
+
+    def __init__(self, path, line_width=LINE_WIDTH, bgzip=False, threads=1):
+        self.path = path
+        self.line_width = line_width
+        self.out = BgzfWriter(path, threads) if bgzip else open(path, "wb")
+        self.offset = 0          # bytes written so far
+        self.index = []          # fai rows:  (name, length, offset, linebases, linewidth)
+        self.name = None
+        self.length = 0
+        self.seq_offset = 0
+        self.col = 0
+        self.started = False
+
+    def begin(self, name):
+        if self.name is not None:
+            self.end()
+        self.name = name
+        self.length = 0
+        self.col = 0
+        self.started = False
+
+    def _start(self):
+        # The header is written with the first bases of the record, so empty records leave no trace
+        if not self.started:
+            self._write(f">{self.name}\n".encode('ascii'))
+            self.seq_offset = self.offset
+            self.started = True
+
+    def write(self, seq):
+        if isinstance(seq, str):
+            seq = seq.encode('ascii')
+        n = len(seq)
+        if n == 0:
+            return
+        self._start()
+        lw = self.line_width
+        self.length += n
+        pos = 0
+
+        # Complete the current partial line
+        if self.col > 0:
+            pos = min(lw - self.col, n)
+            self._write(seq[:pos])
+            self.col += pos
+            if self.col == lw:
+                self._write(b"\n")
+                self.col = 0
+
+        # Full lines
+        full = (n - pos) // lw
+        if full >= WRAP_MIN_LINES:
+            block = np.empty((full, lw + 1), dtype=np.uint8)
+            block[:, :lw] = np.frombuffer(seq, np.uint8, full * lw, pos).reshape(full, lw)
+            block[:, lw] = 10
+            self._write(memoryview(block.reshape(-1)))
+            pos += full * lw
+        elif full > 0:
+            end = pos + full * lw
+            self._write(b"\n".join([seq[i:i + lw] for i in range(pos, end, lw)]) + b"\n")
+            pos = end
+
+        # Start of the next partial line
+        if pos < n:
+            self._write(seq[pos:])
+            self.col = n - pos
+
+    def end(self):
+        if self.name is None:
+            return
+        if self.col > 0:
+            self._write(b"\n")
+        if self.length > 0:
+            # Single line records are indexed with their actual line length, as samtools does
+            linebases = min(self.length, self.line_width)
+            self.index.append((self.name, self.length, self.seq_offset, linebases, linebases + 1))
+        self.name = None
+
+    def close(self):
+        self.end()
+        self.out.close()
+        with open(self.path + ".fai", "w") as f:
+            for row in self.index:
+                f.write("\t".join(str(v) for v in row) + "\n")
+
+    def copy(self, name, f, nbytes, length):
+        '''
+        Write a complete record whose wrapped sequence lines, nbytes in all, are read verbatim from the file f
+        :param length: number of bases in the record
+        '''
+        self.begin(name)
+        if nbytes > 0:
+            self._start()
+        while nbytes > 0:
+            data = f.read(min(nbytes, CHUNK_SIZE))
+            if not data:
+                raise IOError(f"Unexpected end of file copying {name}")
+            self._write(data)
+            nbytes -= len(data)
+        self.length = length
+        self.end()
+
+    def append(self, path, index):
+        '''
+        Append complete records written to a separate file by another FastaWriter, e.g. by a worker process.
+        :param path: the part file
+        :param index: the part writer's fai rows, offsets relative to the part file
+        '''
+        if self.name is not None:
+            self.end()
+        base = self.offset
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                self._write(data)
+        for name, length, offset, linebases, linewidth in index:
+            self.index.append((name, length, base + offset, linebases, linewidth))
+
+    def _write(self, data):
+        self.out.write(data)
+        self.offset += len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,7 +1,13 @@
+import numpy as np
 from extractome.stream import getstream
 
+# Approximate number of bytes of text read per chunk by the columnar parser
+READ_SIZE = 1 << 22
+
 class Feature:
 
+    __slots__ = ('chr', 'start', 'end', 'name', 'score', 'strand', 'color')
+
     def __init__(self, chr, start, end, name='', score=1000, color=None):
         self.chr = chr
         self.start = start
@@ -26,6 +32,144 @@ class Feature:
         else:
             return f"{self.chr}\t{self.start}\t{self.end}\t{self.name}\t{self.score}\t{self.strand}"
 
+class FeatureColumns:
+    '''
+    Compact columnar representation of the features on a single chromosome:  int64 arrays of starts and ends,
+    and optional name and score columns.  Indexing or iterating produces Feature objects on demand.
+    '''
+
+    def __init__(self, chr, starts, ends, names=None, scores=None):
+        self.chr = chr
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.names = names
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        name = self.names[i] if self.names is not None else ''
+        score = self.scores[i] if self.scores is not None else None
+        return Feature(self.chr, int(self.starts[i]), int(self.ends[i]), name, score)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def take(self, idx):
+        '''
+        Return a new FeatureColumns with the rows selected by the index array idx
+        '''
+        return FeatureColumns(self.chr, self.starts[idx], self.ends[idx],
+                              self.names[idx] if self.names is not None else None,
+                              self.scores[idx] if self.scores is not None else None)
+
+    def sort(self):
+        '''
+        Return the features sorted by start.  The sort is stable, features with equal starts keep their input order.
+        '''
+        if len(self) < 2 or np.all(self.starts[1:] >= self.starts[:-1]):
+            return self
+        return self.take(np.argsort(self.starts, kind='stable'))
+
+
+def parse_columns(path, names=True):
+    '''
+    Parse a bed file into columnar form.
+    :param path: Path to bed file, which can be local or url
+    :param names: Boolean specifying whether the name and score columns are kept
+    :return: Dictionary of chromosome name -> FeatureColumns, in file order
+    '''
+    f = None
+    try:
+        f = getstream(path)
+        return parse_bed_columns(f, names)
+    finally:
+        if f:
+            f.close()
+
+
+def parse_bed_columns(f, names=True, read_size=READ_SIZE):
+    chunks = {}
+    while True:
+        lines = f.readlines(read_size)
+        if not lines:
+            break
+
+        # Collect the raw tokens of this chunk by chromosome, then convert each column in bulk
+        cols = {}
+        for line in lines:
+            if not (line.startswith('#') or line.startswith('track') or line.startswith('browser')):
+                tokens = line.rstrip('\n').rstrip('\r').split('\t')
+                if len(tokens) >= 3:
+                    c = cols.get(tokens[0])
+                    if c is None:
+                        c = cols[tokens[0]] = ([], [], [], [])
+                    c[0].append(tokens[1])
+                    c[1].append(tokens[2])
+                    if names:
+                        c[2].append(tokens[3] if len(tokens) > 3 else '')
+                        c[3].append(tokens[4] if len(tokens) > 4 else None)
+
+        for chr, c in cols.items():
+            if chr not in chunks:
+                chunks[chr] = []
+            chunks[chr].append((np.array(c[0]).astype(np.int64), np.array(c[1]).astype(np.int64),
+                                np.array(c[2], dtype=object) if names else None,
+                                np.array(c[3], dtype=object) if names else None))
+
+    columns = {}
+    for chr, clist in chunks.items():
+        starts, ends, name_col, score_col = zip(*clist)
+        columns[chr] = FeatureColumns(chr, np.concatenate(starts), np.concatenate(ends),
+                                      np.concatenate(name_col) if names else None,
+                                      np.concatenate(score_col) if names else None)
+    return columns
+
+
+def iter_bed_chromosomes(f, names=True, read_size=READ_SIZE):
+    '''
+    Stream a coordinate sorted bed file one chromosome at a time.  Each chromosome's lines must be contiguous and
+    sorted by start, which is checked as the file is read.
+    :return: generator of FeatureColumns, one per chromosome, in file order
+    '''
+    seen = set()
+    chr = None
+    c = None
+    for lines in iter(lambda: f.readlines(read_size), []):
+        for line in lines:
+            if line.startswith('#') or line.startswith('track') or line.startswith('browser'):
+                continue
+            tokens = line.rstrip('\n').rstrip('\r').split('\t')
+            if len(tokens) < 3:
+                continue
+            if tokens[0] != chr:
+                if c is not None:
+                    yield sorted_columns(chr, c, names)
+                chr = tokens[0]
+                if chr in seen:
+                    raise ValueError(f"Regions are not sorted:  lines for {chr} are not contiguous")
+                seen.add(chr)
+                c = ([], [], [], [])
+            c[0].append(tokens[1])
+            c[1].append(tokens[2])
+            if names:
+                c[2].append(tokens[3] if len(tokens) > 3 else '')
+                c[3].append(tokens[4] if len(tokens) > 4 else None)
+    if c is not None:
+        yield sorted_columns(chr, c, names)
+
+
+def sorted_columns(chr, c, names):
+    columns = FeatureColumns(chr, np.array(c[0]).astype(np.int64), np.array(c[1]).astype(np.int64),
+                             np.array(c[2], dtype=object) if names else None,
+                             np.array(c[3], dtype=object) if names else None)
+    if np.any(columns.starts[1:] < columns.starts[:-1]):
+        raise ValueError(f"Regions are not sorted:  starts decrease on {chr}")
+    return columns
+
+
 def parse(path, format=None):
     '''
     Parse a feature file and return an array of feature objects.  Supported formats are bed, gff, and gtf.
@@ -43,7 +187,7 @@ def parse(path, format=None):
         if format == 'bed':
             return parse_bed(f)
         elif format == 'gff'  or format == 'gff3' or format == 'gtf':
-            return parse_gff(f)
+            return parse_gff(f, format == 'gtf')
         elif format == 'tab':
             return parse_tab(f)
         elif format == 'bedpe':
@@ -103,20 +247,14 @@ def parse_bedpe(f):
     return features
 
 
-def parse_gff(f):
+def parse_gff(f, gtf=False):
+    # gff builds on this module, import on use
+    from extractome.gff import read_gff
     features = []
-    for line in f:
-        if not (line.startswith('#') or line.startswith('track') or line.startswith('browser')):
-            tokens = line.rstrip('\n').rstrip('\r').split('\t')
-            # if we encounter a blank or malformed line (no start and end coords), skip it
-            if len(tokens) < 5:
-                continue
-            chr = tokens[0]
-            start = int(tokens[3]) - 1
-            end = int(tokens[4])
-            name = ''
-            features.append(Feature(chr, start, end, line, name))
-
+    for record in read_gff(f, gtf=gtf):
+        feature = Feature(record.chr, record.start, record.end, record.name, record.score)
+        feature.strand = record.strand
+        features.append(feature)
     return features
 
 
@@ -1,30 +1,140 @@
-import requests
+import hashlib
 import json
+import os
+import time
+import requests
+from extractome.stream import get_session
+
+GENOMES_URL = "https://igv.org/genomes/genomes.json"
+
+# Default location of the local genome catalog cache, and the time in seconds before a cached catalog is revalidated
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "extractome")
+CACHE_TTL = 24 * 60 * 60
+
+
+def get_genome(id, genomes_url=GENOMES_URL, cache_dir=None, ttl=CACHE_TTL, offline=False):
+    '''
+    Return the igv.js genome definition for a genome id.
+    :param genomes_url: url of the igv.js genome catalog, or a local file standing in for it
+    :param cache_dir: directory for the cached catalog, default ~/.cache/extractome
+    :param ttl: age in seconds after which the cached catalog is revalidated with the server
+    :param offline: if True the genome is resolved from the cache only
+    '''
+
+    genomes = load_catalog(genomes_url, cache_dir, ttl, offline)
+    if genomes is None:
+        return None
+
+    if id in genomes:
+        return genomes[id]
+
+    # genome not found
+    msg = f'Unknown genome ID: {id}. Valid genome values: {", ".join(genomes.keys())}'
+    raise ValueError(msg)
+
+
+def load_catalog(genomes_url=GENOMES_URL, cache_dir=None, ttl=CACHE_TTL, offline=False):
+    '''
+    Load the genome catalog as a dictionary of id -> genome definition, using the local cache when it is fresh.
+    A stale cache is revalidated with the ETag / Last-Modified values from the previous download.
+    '''
 
+    cache_file = catalog_cache_file(genomes_url, cache_dir)
+    cached = None
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            cached = json.load(f)
 
+    if offline:
+        if cached is None:
+            raise ValueError(f'Genome catalog {genomes_url} is not cached, cannot resolve genomes offline')
+        return cached["genomes"]
 
-def get_genome(id):
+    if cached is not None and time.time() - cached["fetched"] < ttl:
+        return cached["genomes"]
 
-    genomes_url = "https://igv.org/genomes/genomes.json"
-    r = requests.get(genomes_url)
+    try:
+        status, genomes, etag, last_modified = fetch_catalog(genomes_url, cached)
+    except (requests.RequestException, OSError) as e:
+        status, genomes, etag, last_modified = str(e), None, None, None
 
-    if r.status_code == 200:
-        genomes = r.json()
-        genome_ids = []
-        for g in genomes:
-            if g["id"] == id:
-                return g
-            genome_ids.append(g["id"])
+    if status == 304:
+        cached["fetched"] = time.time()
+        save_catalog(cache_file, cached)
+        return cached["genomes"]
 
-        # genome not found
-        msg = f'Unknown genome ID: {id}. Valid genome values: {", ".join(genome_ids)}'
-        raise ValueError(msg)
+    elif status == 200:
+        entry = {
+            "url": genomes_url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched": time.time(),
+            "genomes": build_index(genomes)
+        }
+        save_catalog(cache_file, entry)
+        return entry["genomes"]
+
+    elif cached is not None:
+        print(f'Error loading genomes {status}, using cached catalog')
+        return cached["genomes"]
 
     else:
-        print(f'Error loading genomes {r.status_code}')
+        print(f'Error loading genomes {status}')
         return None
 
 
+def fetch_catalog(genomes_url, cached=None):
+    '''
+    Fetch the catalog, conditionally if a cached copy exists.  Local files are validated by modification time and size.
+    :return: tuple (status, genomes, etag, last_modified), genomes is None unless status is 200
+    '''
+
+    if genomes_url.startswith('http://') or genomes_url.startswith('https://'):
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        r = get_session().get(genomes_url, headers=headers)
+        if r.status_code == 200:
+            return 200, r.json(), r.headers.get("ETag"), r.headers.get("Last-Modified")
+        return r.status_code, None, None, None
+
+    else:
+        path = genomes_url[7:] if genomes_url.startswith('file://') else genomes_url
+        stat = os.stat(path)
+        etag = f'{stat.st_mtime_ns}-{stat.st_size}'
+        if cached is not None and cached.get("etag") == etag:
+            return 304, None, None, None
+        with open(path) as f:
+            return 200, json.load(f), etag, None
+
+
+def build_index(genomes):
+    '''
+    Index the catalog list by genome id.  The first definition of an id wins, as with a linear scan of the list.
+    '''
+    index = {}
+    for g in genomes:
+        if g["id"] not in index:
+            index[g["id"]] = g
+    return index
+
+
+def catalog_cache_file(genomes_url, cache_dir=None):
+    cache_dir = cache_dir or CACHE_DIR
+    key = hashlib.sha1(genomes_url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f"genomes-{key}.json")
+
+
+def save_catalog(cache_file, entry):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp, cache_file)
+
 
 def main():
     genome = get_genome("hg38")
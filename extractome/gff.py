@@ -0,0 +1,211 @@
+import numpy as np
+from urllib.parse import unquote
+
+from extractome.feature import FeatureColumns, READ_SIZE
+from extractome.stream import getstream
+
+# Attributes tried in order for a feature's display name
+NAME_ATTRIBUTES = ["gene_name", "Name", "gene_id", "ID", "transcript_id"]
+
+
+def parse_attributes(text, gtf=False):
+    '''
+    Decode the attribute column of a GFF3 (key=value;...) or GTF (key "value"; ...) line.  Repeated GTF keys,
+    e.g. "tag", are joined with commas as in GFF3.
+    :return: dictionary of key -> value
+    '''
+    attributes = {}
+    for field in text.split(';'):
+        field = field.strip()
+        if not field:
+            continue
+        if gtf:
+            key, _, value = field.partition(' ')
+            value = value.strip().strip('"')
+        else:
+            key, _, value = field.partition('=')
+            value = unquote(value)
+        attributes[key] = f"{attributes[key]},{value}" if key in attributes else value
+    return attributes
+
+
+def get_attribute(text, key, gtf=False):
+    '''
+    Value of a single attribute, without decoding the others.  Repeated keys are joined with commas.
+    '''
+    prefix = f"{key} " if gtf else f"{key}="
+    values = []
+    for field in text.split(';'):
+        field = field.strip()
+        if field.startswith(prefix):
+            value = field[len(prefix):]
+            values.append(value.strip().strip('"') if gtf else unquote(value))
+    return ','.join(values) if values else None
+
+
+def attributes_name(attributes):
+    return next((attributes[k] for k in NAME_ATTRIBUTES if k in attributes), '')
+
+
+def attribute_text_name(text, gtf=False):
+    '''
+    The name of a feature from its attribute column, as attributes_name, looking up only the name keys
+    '''
+    for key in NAME_ATTRIBUTES:
+        if key in text:
+            value = get_attribute(text, key, gtf)
+            if value is not None:
+                return value
+    return ''
+
+
+class GFFRecord:
+    '''
+    A GFF3 or GTF line.  The attribute column is kept as text and decoded on first access.
+    Coordinates are 0-based, end exclusive.
+    '''
+
+    __slots__ = ('chr', 'source', 'type', 'start', 'end', 'score', 'strand', 'phase', 'gtf', 'attribute_text',
+                 '_attributes')
+
+    def __init__(self, tokens, gtf=False):
+        self.chr = tokens[0]
+        self.source = tokens[1]
+        self.type = tokens[2]
+        self.start = int(tokens[3]) - 1
+        self.end = int(tokens[4])
+        self.score = tokens[5] if len(tokens) > 5 else '.'
+        self.strand = tokens[6] if len(tokens) > 6 else '.'
+        self.phase = tokens[7] if len(tokens) > 7 else '.'
+        self.gtf = gtf
+        self.attribute_text = tokens[8] if len(tokens) > 8 else ''
+        self._attributes = None
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = parse_attributes(self.attribute_text, self.gtf)
+        return self._attributes
+
+    def get(self, key, default=None):
+        return self.attributes.get(key, default)
+
+    @property
+    def name(self):
+        return attributes_name(self.attributes)
+
+
+class GFFFilter:
+    '''
+    Selects records by feature type and attribute values while a file is read.  The type, in column 3, is checked
+    before any attributes are decoded.
+    :param types: feature types to keep, e.g. ["exon"], None keeps all
+    :param attributes: dictionary of attribute key -> list of accepted values, e.g. {"gene_type": ["protein_coding"]}.
+    A record must match every key, and any of the values of a key.
+    '''
+
+    def __init__(self, types=None, attributes=None):
+        self.types = set(types) if types else None
+        self.attributes = {k: set(v) for k, v in attributes.items()} if attributes else {}
+
+    def accept_type(self, type):
+        return self.types is None or type in self.types
+
+    def accept_attributes(self, text, gtf=False):
+        for key, values in self.attributes.items():
+            # Cheap substring test first, most lines fail it
+            if not any(v in text for v in values):
+                return False
+            value = get_attribute(text, key, gtf)
+            if value is None or not (value in values or any(v in values for v in value.split(','))):
+                return False
+        return True
+
+
+def is_gtf(path):
+    name = path.lower()
+    return name.endswith(".gtf") or name.endswith(".gtf.gz")
+
+
+def read_gff(f, gff_filter=None, gtf=False):
+    '''
+    Generator yielding the records of a GFF3 or GTF stream that pass the filter
+    '''
+    gff_filter = gff_filter or GFFFilter()
+    for line in f:
+        if line.startswith('#'):
+            continue
+        tokens = line.rstrip('\n').rstrip('\r').split('\t')
+        if len(tokens) < 5 or not gff_filter.accept_type(tokens[2]):
+            continue
+        if gff_filter.attributes and not gff_filter.accept_attributes(tokens[8] if len(tokens) > 8 else '', gtf):
+            continue
+        yield GFFRecord(tokens, gtf)
+
+
+def parse_gff_columns(path, gff_filter=None, gtf=None, read_size=READ_SIZE):
+    '''
+    Stream a GFF3 or GTF file into merged regions in columnar form, without creating an object per record.  Records
+    passing the filter are merged where they overlap or abut, chunk by chunk as the file is read, so memory use
+    follows the number of merged regions rather than the number of records.  A merged region is named with the
+    distinct names of its records.
+    :param path: path or url of the file, optionally gzipped
+    :param gtf: True for GTF attribute syntax, inferred from the file name by default
+    :return: dictionary of chromosome name -> FeatureColumns, in file order
+    '''
+    gff_filter = gff_filter or GFFFilter()
+    gtf = is_gtf(path) if gtf is None else gtf
+    chunks = {}
+    with getstream(path) as f:
+        while True:
+            lines = f.readlines(read_size)
+            if not lines:
+                break
+            cols = {}
+            for line in lines:
+                if line.startswith('#'):
+                    continue
+                tokens = line.rstrip('\n').rstrip('\r').split('\t')
+                if len(tokens) < 5 or not gff_filter.accept_type(tokens[2]):
+                    continue
+                text = tokens[8] if len(tokens) > 8 else ''
+                if gff_filter.attributes and not gff_filter.accept_attributes(text, gtf):
+                    continue
+                c = cols.get(tokens[0])
+                if c is None:
+                    c = cols[tokens[0]] = ([], [], [])
+                c[0].append(tokens[3])
+                c[1].append(tokens[4])
+                c[2].append(attribute_text_name(text, gtf))
+
+            for chr, c in cols.items():
+                starts = np.array(c[0]).astype(np.int64) - 1
+                ends = np.array(c[1]).astype(np.int64)
+                chunks.setdefault(chr, []).append(merge_named(starts, ends, np.array(c[2], dtype=object)))
+
+    columns = {}
+    for chr, clist in chunks.items():
+        starts, ends, names = merge_named(*(np.concatenate(a) for a in zip(*clist)))
+        columns[chr] = FeatureColumns(chr, starts, ends, names, np.full(len(starts), None, dtype=object))
+    return columns
+
+
+def merge_named(starts, ends, names):
+    '''
+    Sort and merge overlapping or abutting intervals, as regions.merge_intervals with gap 0.  Each merged interval
+    is named with the distinct names of its parts, comma separated.
+    '''
+    order = np.argsort(starts, kind='stable')
+    starts, ends, names = starts[order], ends[order], names[order]
+    if len(starts) == 0:
+        return starts, ends, names
+    running_end = np.maximum.accumulate(ends)
+    first = np.concatenate(([True], starts[1:] > running_end[:-1]))
+    group_starts = np.flatnonzero(first)
+    group_ends = np.append(group_starts[1:], len(starts))
+    merged_names = np.empty(len(group_starts), dtype=object)
+    for i, (a, b) in enumerate(zip(group_starts.tolist(), group_ends.tolist())):
+        parts = names[a:b]
+        merged_names[i] = parts[0] if b - a == 1 else \
+            ','.join(dict.fromkeys(n for part in parts.tolist() for n in part.split(',') if n))
+    return starts[group_starts], running_end[group_ends - 1], merged_names
@@ -0,0 +1,25 @@
+import asyncio
+
+from extractome.feature import parse_columns
+
+
+async def gather_inputs(region_files, open_reference, parse=parse_columns):
+    '''
+    Parse the region files and open the reference concurrently.  Each input runs in a worker thread, so the download
+    of a remote regions file, the genome catalog lookup, and the fetch of the fasta index overlap rather than waiting
+    for each other.  Remote reads share the pooled http session of stream.get_session.
+    :param region_files: paths or urls of bed files
+    :param open_reference: callable returning the reference, e.g. a tuple (fasta_index, fasta_reader)
+    :param parse: function parsing a region file into columns, default feature.parse_columns
+    :return: tuple (reference, list of columns as returned by parse, in region_files order)
+    '''
+    results = await asyncio.gather(asyncio.to_thread(open_reference),
+                                   *[asyncio.to_thread(parse, path) for path in region_files])
+    return results[0], results[1:]
+
+
+def load_inputs(region_files, open_reference, parse=parse_columns):
+    '''
+    Blocking form of gather_inputs
+    '''
+    return asyncio.run(gather_inputs(region_files, open_reference, parse))
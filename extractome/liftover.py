@@ -1,59 +1,333 @@
-from intervaltree import IntervalTree
+import os
+import re
+import json
+import argparse
+from bisect import bisect_left, bisect_right
+import numpy as np
+from extractome.feature import FeatureColumns
 from extractome.stream import getstream
 
+CHAIN_HEADER = re.compile(r'^chain\b', re.M)
+
+# Files of a compiled liftover index
+INDEX_VERSION = 1
+INDEX_ARRAYS = ["tStarts", "tEnds", "tEndsMax", "qStarts", "chains"]
+
 
 def load_liftover(chains_file):
+    '''
+    Load a liftover from a UCSC chain file, or from an index directory written by compile_liftover
+    '''
+    if os.path.isdir(chains_file):
+        return load_index(chains_file)
+
+    with getstream(chains_file) as f:
+        text = f.read()
+    return Liftover(parse_chains(text))
+
+
+def parse_chains(text):
+    '''
+    Parse the chains of a UCSC chain file.  The alignment data of each chain is converted to integers in bulk.
+    '''
     chains = []
-    chain = None
-    data = []
-
-    with  getstream(chains_file) as f:
-        for line in f:
-            line = line.strip()
-            if len(line) == 0:
-                # end of chain
-                if chain is not None:
-                    chain.set_alignments(data)
-                    chains.append(chain)
-                    chain = None
-                    data = []
-            elif line.startswith("chain"):
-                t = line.split()
-                # chain score tName tSize tStrand tStart tEnd qName qSize qStrand qStart qEnd id
-                chain = Chain(t[2], int(t[3]), int(t[5]), int(t[6]), t[7], int(t[8]), int(t[10]), int(t[11]), t[12])
-            else:
-                t = line.split()
-                for i in range(len(t)):
-                    t[i] = int(t[i])
-                data.append(t)
-
-    # Last data
-    if chain is not None and len(data) > 0:
-        chain.set_alignments(data)
+    offsets = [m.start() for m in CHAIN_HEADER.finditer(text)]
+    offsets.append(len(text))
+    for i in range(len(offsets) - 1):
+        header, _, body = text[offsets[i]:offsets[i + 1]].partition('\n')
+        t = header.split()
+        # chain score tName tSize tStrand tStart tEnd qName qSize qStrand qStart qEnd id
+        chain = Chain(t[2], int(t[3]), int(t[5]), int(t[6]), t[7], int(t[8]), int(t[10]), int(t[11]),
+                      t[12] if len(t) > 12 else str(i + 1), t[9])
+
+        # size dt dq triples, the last block has size only
+        data = np.array(body.split(), dtype=np.int64)
+        chain.set_block_columns(data[0::3], data[1::3], data[2::3])
         chains.append(chain)
+    return chains
 
-    return Liftover(chains)
 
+def compile_liftover(chains_file, index_dir):
+    '''
+    Compile a chain file into a binary index directory:  sorted block arrays for all chains, stored as ".npy" files
+    that are memory-mapped on load, and a json table of chain headers and per-target offsets into the arrays.
+    '''
+    liftover = load_liftover(chains_file)
+    os.makedirs(index_dir, exist_ok=True)
 
-class Liftover:
+    arrays = {name: [] for name in INDEX_ARRAYS}
+    targets = {}
+    offset = 0
+    position = {id(c): i for i, c in enumerate(liftover.chains)}
+    for tName, blocks in liftover.index.items():
+        # Chain ids in the index refer to positions in the full chain list
+        global_ids = np.array([position[id(c)] for c in blocks.chains], dtype=np.int32)
+        arrays["tStarts"].append(blocks.tStarts)
+        arrays["tEnds"].append(blocks.tEnds)
+        arrays["tEndsMax"].append(blocks.tEndsMax)
+        arrays["qStarts"].append(blocks.qStarts)
+        arrays["chains"].append(global_ids[blocks.chain_ids])
+        targets[tName] = [offset, len(blocks.tStarts)]
+        offset += len(blocks.tStarts)
 
-    def __init__(self, chains):
+    for name, a in arrays.items():
+        dtype = np.int32 if name == "chains" else np.int64
+        np.save(os.path.join(index_dir, f"{name}.npy"),
+                np.concatenate(a).astype(dtype) if len(a) > 0 else np.empty(0, dtype=dtype))
+
+    index = {
+        "version": INDEX_VERSION,
+        "chains": [c.header() for c in liftover.chains],
+        "targets": targets
+    }
+    with open(os.path.join(index_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+
+
+def load_index(index_dir):
+    '''
+    Load a compiled liftover index.  Block arrays are memory-mapped, so loading cost is independent of their size.
+    '''
+    with open(os.path.join(index_dir, "index.json")) as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        raise ValueError(f"Unsupported liftover index version: {index_dir}")
+
+    arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r') for name in INDEX_ARRAYS}
+    chains = [Chain(*h) for h in index["chains"]]
+    table = chain_table(chains)
+    blocks = {}
+    for tName, (offset, n) in index["targets"].items():
+        s = slice(offset, offset + n)
+        blocks[tName] = BlockIndex(arrays["tStarts"][s], arrays["tEnds"][s], arrays["tEndsMax"][s],
+                                   arrays["qStarts"][s], arrays["chains"][s], chains, table)
+    return Liftover(chains, blocks)
+
+
+def overlapping_blocks(tStarts, tEnds, tEndsMax, starts, ends):
+    '''
+    Find the blocks overlapping each of the intervals [starts[i], ends[i]).  Blocks are sorted by start, tEndsMax is
+    the running maximum of block ends, which keeps the binary search valid when blocks overlap.
+    :return: tuple of arrays (rows, blocks), one element per overlapping (interval, block) pair, ordered by
+    interval then block
+    '''
+    lo = np.searchsorted(tEndsMax, starts, side='right')
+    hi = np.searchsorted(tStarts, ends, side='left')
+    counts = np.where(ends > starts, np.maximum(hi - lo, 0), 0)
+
+    # Expand each interval into one row per candidate block
+    rows = np.repeat(np.arange(len(starts)), counts)
+    first = np.cumsum(counts) - counts
+    blocks = np.arange(len(rows)) - np.repeat(first, counts) + np.repeat(lo, counts)
+    keep = tEnds[blocks] > starts[rows]
+    return rows[keep], blocks[keep]
+
+
+def project(tStarts, tEnds, qStarts, starts, ends):
+    '''
+    Project intervals onto the query coordinates of the blocks they overlap
+    '''
+    ds = starts - tStarts
+    qEnds = qStarts + (tEnds - tStarts)
+    return np.maximum(qStarts, qStarts + ds), np.minimum(qEnds, qStarts + ds + (ends - starts))
 
-        self.chain_dict = {}
 
+class Liftover:
+
+    def __init__(self, chains, index=None):
+        '''
+        :param chains: list of Chain objects.  A target sequence can have any number of chains.
+        :param index: dictionary of target name -> BlockIndex, built from the chains if not supplied
+        '''
+        self.chains = chains
+        self.chain_dict = {}
         for c in chains:
-            self.chain_dict[c.tName] = c
+            if c.tName not in self.chain_dict:
+                self.chain_dict[c.tName] = []
+            self.chain_dict[c.tName].append(c)
+
+        if index is None:
+            index = {tName: BlockIndex.from_chains(clist) for tName, clist in self.chain_dict.items()}
+        self.index = index
 
     def map(self, feature):
 
-        if feature.chr in self.chain_dict:
-            return self.chain_dict[feature.chr].map(feature)
+        if feature.chr in self.index:
+            return self.index[feature.chr].map(feature)
+
+    def map_columns(self, columns):
+        '''
+        Map features in columnar form, see feature.FeatureColumns.  Name and score columns are carried over.
+        :return: Dictionary of mapped chromosome name -> FeatureColumns, rows ordered as for map_many
+        '''
+        rows, chroms, starts, ends = self.map_many(columns.chr, columns.starts, columns.ends)
+        names = columns.names[rows] if columns.names is not None else None
+        scores = columns.scores[rows] if columns.scores is not None else None
+
+        mapped = {}
+        for chr in dict.fromkeys(chroms):
+            mapped[chr] = FeatureColumns(chr, starts, ends, names, scores).take(np.flatnonzero(chroms == chr))
+        return mapped
+
+    def map_many(self, chroms, starts, ends, strands=False):
+        '''
+        Map many features at once, given as column arrays.  Inputs are sorted once per chromosome and swept against
+        the chain blocks.  A feature spanning several blocks, or aligned by several chains, produces several rows,
+        features on chromosomes without a chain produce none.
+        :param chroms: array of chromosome names, or a single name shared by all features
+        :param starts: array of 0-based starts
+        :param ends: array of 0-based exclusive ends
+        :param strands: if True also return the query strand of the chain for each row
+        :return: tuple of arrays (rows, chroms, starts, ends[, strands]).  rows holds the index of the input feature
+        for each mapped row.  Rows are ordered by input feature, and by position within a feature.
+        '''
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        if isinstance(chroms, str):
+            groups = [(chroms, np.arange(len(starts)))]
+        else:
+            chroms = np.asarray(chroms, dtype=object)
+            groups = [(c, np.flatnonzero(chroms == c)) for c in np.unique(chroms)]
+
+        results = []
+        for chr, idx in groups:
+            if chr not in self.index or len(idx) == 0:
+                continue
+            idx = idx[np.argsort(starts[idx], kind='stable')]
+            rows, mchroms, mstarts, mends, mstrands = self.index[chr].map_many(starts[idx], ends[idx])
+            results.append((idx[rows], mchroms, mstarts, mends, mstrands))
+
+        if len(results) == 0:
+            results = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=object),
+                        np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=object))]
+
+        rows, mchroms, mstarts, mends, mstrands = (np.concatenate(c) for c in zip(*results))
+        order = np.argsort(rows, kind='stable')
+        mapped = rows[order], mchroms[order], mstarts[order], mends[order]
+        return mapped + (mstrands[order],) if strands else mapped
+
+
+class BlockIndex:
+    '''
+    The ungapped blocks of all chains on a target sequence, sorted by target start
+    '''
+
+    def __init__(self, tStarts, tEnds, tEndsMax, qStarts, chain_ids, chains, table=None):
+        '''
+        :param table: the chain_table of chains, if already computed
+        '''
+        self.tStarts = tStarts
+        self.tEnds = tEnds
+        self.tEndsMax = tEndsMax
+        self.qStarts = qStarts
+        self.chain_ids = chain_ids
+        self.chains = chains
+        self.qNames, self.qSizes, self.reverse = table if table is not None else chain_table(chains)
+        self.lists = None
+
+    @staticmethod
+    def from_chains(chains):
+        '''
+        :param chains: list of Chain objects on the same target sequence.  Chain ids in the index refer to positions
+        in this list.
+        '''
+        if len(chains) == 1:
+            c = chains[0]
+            return BlockIndex(c.tStarts, c.tEnds, c.tEndsMax, c.qStarts, np.zeros(len(c.tStarts), dtype=np.int32), chains)
+
+        tStarts = np.concatenate([c.tStarts for c in chains])
+        tEnds = np.concatenate([c.tEnds for c in chains])
+        qStarts = np.concatenate([c.qStarts for c in chains])
+        chain_ids = np.repeat(np.arange(len(chains), dtype=np.int32), [len(c.tStarts) for c in chains])
+        order = np.argsort(tStarts, kind='stable')
+        tEnds = tEnds[order]
+        tEndsMax = np.maximum.accumulate(tEnds) if len(tEnds) > 0 else tEnds
+        return BlockIndex(tStarts[order], tEnds, tEndsMax, qStarts[order], chain_ids[order], chains)
+
+    def block_lists(self):
+        '''
+        The block and chain arrays as Python lists, built on first use, for the scalar path of map
+        '''
+        if self.lists is None:
+            self.lists = (self.tStarts.tolist(), self.tEnds.tolist(), self.tEndsMax.tolist(), self.qStarts.tolist(),
+                          self.chain_ids.tolist(), self.qNames.tolist(), self.qSizes.tolist(), self.reverse.tolist())
+        return self.lists
+
+    def map_one(self, start, end):
+        '''
+        Map a single interval with a binary search of the block lists, the scalar form of map_many
+        :return: list of (chrom, start, end, strand) tuples in forward query coordinates, ordered as for map_many
+        '''
+        tStarts, tEnds, tEndsMax, qStarts, chain_ids, qNames, qSizes, reverse = self.block_lists()
+        mapped = []
+        if end <= start:
+            return mapped
+        for b in range(bisect_right(tEndsMax, start), bisect_left(tStarts, end)):
+            tEnd = tEnds[b]
+            if tEnd <= start:
+                continue
+            tStart = tStarts[b]
+            qStart = qStarts[b]
+            ds = start - tStart
+            mstart = max(qStart, qStart + ds)
+            mend = min(qStart + tEnd - tStart, qStart + ds + end - start)
+            id = chain_ids[b]
+            if reverse[id]:
+                mapped.append((qNames[id], qSizes[id] - mend, qSizes[id] - mstart, '-'))
+            else:
+                mapped.append((qNames[id], mstart, mend, '+'))
+        return mapped
+
+    def map(self, feature):
+        '''
+        Map a single feature.  A feature might span multiple blocks, each produces a mapped feature.
+        '''
+        mapped = []
+        for chr, start, end, strand in self.map_one(feature.start, feature.end):
+            mf = feature.clone()
+            mf.chr = chr
+            mf.start = start
+            mf.end = end
+            mf.strand = feature.strand if strand == '+' else flip(feature.strand)
+            mapped.append(mf)
+        return mapped
+
+    def map_many(self, starts, ends):
+        '''
+        :return: tuple of arrays (rows, chroms, starts, ends, strands) in forward query coordinates
+        '''
+        rows, blocks = overlapping_blocks(self.tStarts, self.tEnds, self.tEndsMax, starts, ends)
+        mstarts, mends = project(self.tStarts[blocks], self.tEnds[blocks], self.qStarts[blocks], starts[rows], ends[rows])
+
+        # Blocks of reverse strand chains are in reverse complement coordinates of the query
+        ids = self.chain_ids[blocks]
+        reverse = self.reverse[ids]
+        if np.any(reverse):
+            sizes = self.qSizes[ids]
+            mstarts, mends = np.where(reverse, sizes - mends, mstarts), np.where(reverse, sizes - mstarts, mends)
+
+        strands = np.where(reverse, '-', '+').astype(object)
+        return rows, self.qNames[ids], mstarts, mends, strands
+
+
+def chain_table(chains):
+    '''
+    Per chain lookup arrays of query name, query size, and reverse strand flag
+    '''
+    return np.array([c.qName for c in chains], dtype=object), \
+           np.array([c.qSize for c in chains], dtype=np.int64), \
+           np.array([c.qStrand == '-' for c in chains], dtype=bool)
+
+
+def flip(strand):
+    return '-' if strand == '+' else '+' if strand == '-' else strand
 
 
 # chain score tName tSize tStrand tStart tEnd qName qSize qStrand qStart qEnd id
 class Chain:
 
-    def __init__(self, tName, tSize, tStart, tEnd, qName, qSize, qStart, qEnd, id):
+    def __init__(self, tName, tSize, tStart, tEnd, qName, qSize, qStart, qEnd, id, qStrand='+'):
         self.tName = tName
         self.tSize = tSize
         self.tStart = tStart
@@ -63,48 +337,164 @@ class Chain:
         self.qStart = qStart
         self.qEnd = qEnd
         self.id = id
+        self.qStrand = qStrand
 
-    def set_alignments(self, data):
-        self.tree = self.build_tree(data)
-
-    def build_tree(self, data):
+    def header(self):
+        '''
+        Return the constructor arguments of this chain, i.e. the header values without the alignment data
+        '''
+        return [self.tName, self.tSize, self.tStart, self.tEnd, self.qName, self.qSize, self.qStart, self.qEnd,
+                self.id, self.qStrand]
 
-        tree = IntervalTree()
+    def set_alignments(self, data):
+        self.build_blocks(data)
 
-        tStart = self.tStart
-        qStart = self.qStart
-        for a in data:
-            '''
-            a is a tuple with 3 elements, with the exception of the last tuple which has only the first
+    def build_blocks(self, data):
+        '''
+        Build sorted arrays of ungapped alignment blocks.  Each element of data is a tuple with 3 elements, with
+        the exception of the last tuple which has only the first
             size -- the size of the ungapped alignment
             dt -- the difference between the end of this block and the beginning of the next block (reference/target sequence)
             dq -- the difference between the end of this block and the beginning of the next block (query sequence)
-            '''
-            tEnd = tStart + a[0]
-            qEnd = qStart + a[0]
-            tree[tStart:tEnd] = (qStart, qEnd)
+        '''
+        n = len(data)
+        sizes = np.fromiter((a[0] for a in data), dtype=np.int64, count=n)
+        dt = np.fromiter((a[1] if len(a) == 3 else 0 for a in data), dtype=np.int64, count=n)
+        dq = np.fromiter((a[2] if len(a) == 3 else 0 for a in data), dtype=np.int64, count=n)
+        self.set_block_columns(sizes, dt[:n - 1], dq[:n - 1])
+
+    def set_block_columns(self, sizes, dt, dq):
+        '''
+        Set the alignment blocks from the columns of the chain data:  block sizes, and the target and query gaps
+        following each block except the last
+        '''
+        n = len(sizes)
+        tStarts = np.empty(n, dtype=np.int64)
+        qStarts = np.empty(n, dtype=np.int64)
+        if n > 0:
+            tStarts[0] = self.tStart
+            qStarts[0] = self.qStart
+            np.cumsum(sizes[:-1] + dt[:n - 1], out=tStarts[1:])
+            np.cumsum(sizes[:-1] + dq[:n - 1], out=qStarts[1:])
+            tStarts[1:] += self.tStart
+            qStarts[1:] += self.qStart
+
+        self.set_blocks(tStarts, qStarts, sizes)
+
+    def set_blocks(self, tStarts, qStarts, sizes):
+        '''
+        Set the alignment blocks directly from arrays of target starts, query starts, and block sizes.
+        '''
+        tStarts = np.asarray(tStarts, dtype=np.int64)
+        qStarts = np.asarray(qStarts, dtype=np.int64)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        if len(tStarts) > 1 and np.any(tStarts[1:] < tStarts[:-1]):
+            order = np.argsort(tStarts, kind='stable')
+            tStarts, qStarts, sizes = tStarts[order], qStarts[order], sizes[order]
 
-            if len(a) == 3:
-                tStart += (a[0] + a[1])
-                qStart += a[0]
+        self.tStarts = tStarts
+        self.tEnds = tStarts + sizes
+        self.qStarts = qStarts
+        # Running maximum of block ends.  Blocks are sorted by start but may overlap, this keeps the
+        # binary search for the first overlapping block valid
+        self.tEndsMax = np.maximum.accumulate(self.tEnds) if len(sizes) > 0 else self.tEnds
+        self.index = None
 
-        return tree
+    def block_index(self):
+        if self.index is None:
+            self.index = BlockIndex.from_chains([self])
+        return self.index
+
+    def overlapping(self, start, end):
+        '''
+        Return the indices of blocks overlapping the target interval [start, end)
+        '''
+        rows, blocks = overlapping_blocks(self.tStarts, self.tEnds, self.tEndsMax,
+                                          np.array([start], dtype=np.int64), np.array([end], dtype=np.int64))
+        return blocks
+
+    def map_many(self, starts, ends):
+        '''
+        Vectorized form of map for arrays of feature starts and ends.  Starts should be sorted for best performance.
+        :return: tuple of arrays (rows, starts, ends), rows holds the index of the input feature for each mapped row
+        '''
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        rows, mchroms, mstarts, mends, strands = self.block_index().map_many(starts, ends)
+        return rows, mstarts, mends
 
     def map(self, f):
+        return self.block_index().map(f)
 
-        mapped = []
 
-        intervals = self.tree[f.start:f.end]
-        if intervals is not None:
+def lift_file(liftover, input, output, format=None, read_size=1 << 24):
+    '''
+    Lift a bed or gff/gtf file, writing each mapped row with its coordinates (and strand) replaced and all other
+    columns unchanged.  The file is processed in chunks of about read_size bytes.
+    :return: tuple (number of input features, number of unmapped features)
+    '''
+    if format is None:
+        format = 'gff' if re.search(r'\.(gff3?|gtf)(\.gz)?$', input.lower()) else 'bed'
+    # Column positions of chr, start, end, strand, and the offset of start from 0-based
+    chr_col, start_col, end_col, strand_col, base = (0, 3, 4, 6, 1) if format in ('gff', 'gff3', 'gtf') else (0, 1, 2, 5, 0)
 
-            # A feature might span multiple intervals
-            for i in intervals:
-                ds = f.start - i.begin
+    total = unmapped = 0
+    with getstream(input) as f, open(output, "w") as o:
+        while True:
+            lines = f.readlines(read_size)
+            if not lines:
+                break
+            rows = []
+            for line in lines:
+                if line.startswith('#') or line.startswith('track') or line.startswith('browser'):
+                    o.write(line)
+                    continue
+                tokens = line.rstrip('\n').rstrip('\r').split('\t')
+                if len(tokens) > end_col:
+                    rows.append(tokens)
+            if len(rows) == 0:
+                continue
 
-                mf = f.clone()
-                mf.chr = self.qName
-                mf.start = max(i.data[0], i.data[0] + ds)
-                mf.end = min(i.data[1], i.data[0] + ds + f.size())
-                mapped.append(mf)
+            chroms = np.array([t[chr_col] for t in rows], dtype=object)
+            starts = np.array([t[start_col] for t in rows]).astype(np.int64) - base
+            ends = np.array([t[end_col] for t in rows]).astype(np.int64)
+            idx, mchroms, mstarts, mends, mstrands = liftover.map_many(chroms, starts, ends, strands=True)
 
-        return mapped
+            total += len(rows)
+            unmapped += len(rows) - len(np.unique(idx))
+            for i, chr, start, end, strand in zip(idx.tolist(), mchroms, mstarts.tolist(), mends.tolist(), mstrands):
+                tokens = list(rows[i])
+                tokens[chr_col] = chr
+                tokens[start_col] = str(start + base)
+                tokens[end_col] = str(end)
+                if strand == '-' and len(tokens) > strand_col:
+                    tokens[strand_col] = flip(tokens[strand_col])
+                o.write('\t'.join(tokens) + '\n')
+
+    return total, unmapped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lift features with UCSC chain files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = subparsers.add_parser("compile", help="compile a chain file into a binary index directory")
+    compile_parser.add_argument("chain", help="chain file")
+    compile_parser.add_argument("index", help="output index directory")
+
+    map_parser = subparsers.add_parser("map", help="lift a bed or gff/gtf file")
+    map_parser.add_argument("chain", help="chain file or compiled index directory")
+    map_parser.add_argument("input", help="bed or gff/gtf file")
+    map_parser.add_argument("output", help="output file")
+    map_parser.add_argument("--format", default=None, help="input format, bed | gff | gtf, inferred from the file name by default")
+
+    args = parser.parse_args()
+    if args.command == "compile":
+        compile_liftover(args.chain, args.index)
+    else:
+        total, unmapped = lift_file(load_liftover(args.chain), args.input, args.output, args.format)
+        print(f"{total - unmapped} of {total} features mapped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+
+import pysam
+
+from extractome.fasta import CHUNK_SIZE, read_fai
+
+MANIFEST_VERSION = 1
+
+
+def region_hash(starts, ends, source=None):
+    '''
+    Content hash of a chromosome's extraction regions
+    :param source: fasta sequence name the regions are read from, if it differs from the chromosome name
+    '''
+    h = hashlib.sha1()
+    h.update(starts.astype('<i8').tobytes())
+    h.update(ends.astype('<i8').tobytes())
+    if source is not None:
+        h.update(source.encode('utf-8'))
+    return h.hexdigest()
+
+
+def source_fingerprint(path, sizes):
+    '''
+    Fingerprint of the source fasta:  its location, sequence names and sizes, and for local files the file size and
+    modification time.  Hashing the full content of a multi-gigabyte reference on every run would defeat the purpose.
+    :param sizes: dictionary of sequence name -> length
+    '''
+    h = hashlib.sha1()
+    h.update(path.encode('utf-8'))
+    h.update(json.dumps(sizes).encode('utf-8'))
+    if os.path.exists(path):
+        stat = os.stat(path)
+        h.update(f"{stat.st_size} {stat.st_mtime_ns}".encode('utf-8'))
+    return h.hexdigest()
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def save_manifest(path, settings, chromosomes):
+    '''
+    :param settings: dictionary of the values that affect every record (source fingerprint, fasta format)
+    :param chromosomes: dictionary of chromosome name -> region hash
+    '''
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "settings": settings,
+        "chromosomes": chromosomes
+    }
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=4)
+
+
+def open_previous(manifest_path, fasta_path, settings, hashes, bgzip):
+    '''
+    Open the fasta written by a previous run for reuse, if its manifest shows it was built with the same settings.
+    The previous files, manifest included, are moved aside so the new fasta can be written in their place.  They
+    are deleted by PreviousFasta.close once the new fasta is complete, or moved back by PreviousFasta.restore.
+    :param hashes: dictionary of chromosome name -> region hash for this run
+    :return: a PreviousFasta, or None if nothing can be reused
+    '''
+    manifest = load_manifest(manifest_path)
+    if manifest is None or manifest["settings"] != settings or \
+            not os.path.exists(fasta_path) or not os.path.exists(fasta_path + ".fai"):
+        return None
+
+    # The index files keep their extensions, as readers expect them next to the fasta
+    prev_path = fasta_path + ".prev"
+    moved = {}
+    for path, prev in [(fasta_path + ext, prev_path + ext) for ext in ["", ".fai", ".gzi"]] + \
+            [(manifest_path, manifest_path + ".prev")]:
+        if os.path.exists(path):
+            os.replace(path, prev)
+            moved[path] = prev
+
+    try:
+        previous = PreviousFasta(prev_path, bgzip, moved)
+    except BaseException:
+        for path, prev in moved.items():
+            os.replace(prev, path)
+        raise
+    previous.reusable = {chr for chr, h in hashes.items()
+                         if manifest["chromosomes"].get(chr) == h and chr in previous.index}
+    return previous
+
+
+class PreviousFasta:
+    '''
+    The fasta written by a previous run, from which unchanged records are copied
+    '''
+
+    def __init__(self, path, bgzip, moved=None):
+        '''
+        :param moved: dictionary of original path -> path the previous file was moved to
+        '''
+        self.path = path
+        self.bgzip = bgzip
+        self.moved = moved or {}
+        self.index = read_fai(path + ".fai")
+        self.reader = pysam.FastaFile(path) if bgzip else None
+        self.file = None if bgzip else open(path, "rb")
+        self.reusable = set()
+
+    def copy_record(self, writer, chr):
+        '''
+        Copy the record for chr to the writer.  Plain text records are copied verbatim, sequence from a block
+        gzipped file is decompressed and rewrapped, which yields the same bytes for the same line width.
+        '''
+        length, offset, linebases, linewidth = self.index[chr]
+        if self.bgzip:
+            writer.begin(chr)
+            for start in range(0, length, CHUNK_SIZE):
+                writer.write(self.reader.fetch(chr, start, min(start + CHUNK_SIZE, length)))
+            writer.end()
+        else:
+            nbytes = (length // linebases) * linewidth + (length % linebases + 1 if length % linebases else 0)
+            self.file.seek(offset)
+            writer.copy(chr, self.file, nbytes, length)
+
+    def close(self):
+        '''
+        Close and delete the previous files
+        '''
+        self.close_files()
+        for prev in self.moved.values():
+            if os.path.exists(prev):
+                os.remove(prev)
+
+    def restore(self):
+        '''
+        Close and move the previous files back in place of any partial new output
+        '''
+        self.close_files()
+        fasta_path = self.path[:-len(".prev")]
+        for path in [fasta_path, fasta_path + ".fai", fasta_path + ".gzi"]:
+            if path not in self.moved and os.path.exists(path):
+                os.remove(path)
+        for path, prev in self.moved.items():
+            os.replace(prev, path)
+
+    def close_files(self):
+        if self.reader is not None:
+            self.reader.close()
+        if self.file is not None:
+            self.file.close()
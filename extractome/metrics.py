@@ -0,0 +1,134 @@
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is not reported there
+    resource = None
+
+
+def peak_rss():
+    '''
+    Peak resident set size of this process in bytes, or None if it cannot be determined
+    '''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def file_size(path):
+    '''
+    Size of a local file, None for urls and missing files
+    '''
+    return os.path.getsize(path) if path is not None and os.path.isfile(path) else None
+
+
+class Stage:
+    '''
+    Measurements of one stage.  Callers fill in the counters they know, the timing and peak RSS are recorded
+    when the stage ends.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self.regions = None
+        self.peak_rss = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "regions": self.regions,
+            "peak_rss": self.peak_rss
+        }
+
+
+class Metrics:
+    '''
+    Lightweight per-stage instrumentation:  wall time, bytes read and written, region counts, and peak RSS.
+    With profile=True stages marked as hot are also run under cProfile, see save_profile.
+
+    Usage:
+        with metrics.stage("fasta", hot=True) as stage:
+            ...
+            stage.regions = n
+    '''
+
+    def __init__(self, profile=False):
+        self.stages = []
+        self.profiler = cProfile.Profile() if profile else None
+
+    @contextmanager
+    def stage(self, name, hot=False):
+        stage = Stage(name)
+        profiler = self.profiler if hot else None
+        if profiler is not None:
+            profiler.enable()
+        t0 = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - t0
+            if profiler is not None:
+                profiler.disable()
+            stage.peak_rss = peak_rss()
+            self.stages.append(stage)
+
+    def total_seconds(self):
+        return sum(s.seconds for s in self.stages)
+
+    def to_dict(self):
+        return {
+            "seconds": self.total_seconds(),
+            "peak_rss": peak_rss(),
+            "stages": [s.to_dict() for s in self.stages]
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def save_profile(self, path):
+        '''
+        Write the cProfile statistics of the hot stages, for pstats or snakeviz
+        '''
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+    def summary(self):
+        '''
+        :return: the measurements as a text table
+        '''
+        rows = [("stage", "seconds", "read", "written", "regions", "MB/s", "peak RSS")]
+        for s in self.stages:
+            nbytes = max(s.bytes_read or 0, s.bytes_written or 0)
+            rows.append((s.name, f"{s.seconds:.3f}", format_bytes(s.bytes_read), format_bytes(s.bytes_written),
+                         "" if s.regions is None else str(s.regions),
+                         f"{nbytes / s.seconds / 1e6:.1f}" if nbytes and s.seconds > 0 else "",
+                         format_bytes(s.peak_rss)))
+        rows.append(("total", f"{self.total_seconds():.3f}", "", "", "", "", format_bytes(peak_rss())))
+
+        widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+        return "\n".join("  ".join(v.ljust(w) if i == 0 else v.rjust(w) for i, (v, w) in enumerate(zip(r, widths)))
+                         for r in rows)
+
+
+def format_bytes(n):
+    if n is None:
+        return ""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
@@ -1,4 +1,4 @@
-
+import numpy as np
 
 def merge_regions(regions, threhold = 500):
 
@@ -38,6 +38,42 @@ def merge_regions(regions, threhold = 500):
     return merged_regions
 
 
+def merge_intervals(starts, ends, gap=0):
+    '''
+    Merge overlapping intervals, and intervals separated by no more than gap bases.
+    :param starts: array of 0-based starts, sorted
+    :param ends: array of 0-based exclusive ends
+    :param gap: maximum distance between intervals that are merged, 0 merges overlapping and adjacent intervals
+    :return: tuple of arrays (starts, ends) of the merged intervals
+    '''
+    if gap < 0:
+        raise ValueError(f"Merge gap must not be negative: {gap}")
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if len(starts) < 2:
+        return starts, ends
+
+    # An interval starts a new group if it begins more than gap past the furthest end seen so far
+    run_end = np.maximum.accumulate(ends)
+    first = np.flatnonzero(np.concatenate(([True], starts[1:] - run_end[:-1] > gap)))
+    return starts[first], np.maximum.reduceat(ends, first)
+
+
+def pad_intervals(starts, ends, pad, size=None):
+    '''
+    Extend intervals by pad bases on both sides, clipped to the chromosome.
+    :param size: chromosome size, if known
+    :return: tuple of arrays (starts, ends)
+    '''
+    if pad < 0:
+        raise ValueError(f"Pad must not be negative: {pad}")
+    starts = np.maximum(np.asarray(starts, dtype=np.int64) - pad, 0)
+    ends = np.asarray(ends, dtype=np.int64) + pad
+    if size is not None:
+        ends = np.minimum(ends, size)
+    return starts, ends
+
+
 def parse_region(locus_string):
 
     tokens = locus_string.split(":")
@@ -0,0 +1,230 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+import requests
+
+from extractome import regions
+from extractome.chralias import build_aliastable
+from extractome.fasta import read_fai
+from extractome.stream import get_session
+
+# Size in bytes of a cached block of the remote file
+BLOCK_SIZE = 1 << 20
+
+# Maximum number of blocks fetched by a single range request
+MAX_REQUEST_BLOCKS = 32
+
+# Number of blocks kept in memory, and on disk when a cache directory is used
+MEMORY_BLOCKS = 128
+DISK_BLOCKS = 4096
+
+
+class RemoteFastaReader:
+    '''
+    Reader for an uncompressed, indexed fasta file served over http(s).  The file is read in fixed size blocks with
+    range requests.  Blocks are kept in an in-memory LRU cache, and optionally in an on-disk cache shared between runs.
+    Calling prefetch with the regions about to be read lets neighbouring blocks be coalesced into large requests.
+    '''
+
+    def __init__(self, url, index_url=None, cache_dir=None, block_size=BLOCK_SIZE,
+                 max_request_blocks=MAX_REQUEST_BLOCKS, memory_blocks=MEMORY_BLOCKS, disk_blocks=DISK_BLOCKS):
+
+        self.url = url
+        self.block_size = block_size
+        self.max_request_blocks = max_request_blocks
+        self.memory_blocks = memory_blocks
+        self.disk_blocks = disk_blocks
+        self.session = get_session()
+        self.blocks = OrderedDict()
+        self.planned = np.empty(0, dtype=np.int64)
+        self.requests = 0
+
+        self.index = read_fai(index_url or url + ".fai")
+        self.sizes = {name: v[0] for name, v in self.index.items()}
+        self.aliastable = build_aliastable(list(self.index.keys()))
+
+        self.cache_dir = None
+        if cache_dir is not None:
+            key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+            self.cache_dir = os.path.join(cache_dir, "fasta", key)
+            self.validate_disk_cache()
+
+    def validate_disk_cache(self):
+        '''
+        Discard the on-disk blocks if the remote file has changed since they were fetched
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        validator_file = os.path.join(self.cache_dir, "validator")
+        try:
+            r = self.session.head(self.url, allow_redirects=True)
+            validator = f'{r.headers.get("ETag", "")} {r.headers.get("Content-Length", "")}'
+        except requests.RequestException:
+            # Offline, trust the cache
+            return
+
+        previous = None
+        if os.path.exists(validator_file):
+            with open(validator_file) as f:
+                previous = f.read()
+        if previous != validator:
+            for name in os.listdir(self.cache_dir):
+                os.remove(os.path.join(self.cache_dir, name))
+            with open(validator_file, "w") as f:
+                f.write(validator)
+
+    def slice(self, region=None):
+
+        if isinstance(region, str):
+            region = regions.parse_region(region)
+
+        chr = self.chrname(region["chr"])
+        start = region["start"] - 1
+        end = region["end"]
+        b0, b1 = self.byte_range(chr, start, end)
+        return self.read(b0, b1).replace(b"\n", b"").replace(b"\r", b"").decode('ascii')
+
+    def chunks(self, chr, start, end, chunk_size=None):
+        chunk_size = chunk_size or self.block_size
+        for s in range(start, end, chunk_size):
+            yield self.slice({"chr": chr, "start": s + 1, "end": min(s + chunk_size, end)})
+
+    def prefetch(self, chr, starts, ends):
+        '''
+        Register the regions about to be read.  Blocks they cover are then fetched together in coalesced requests.
+        :param starts: array of 0-based region starts
+        :param ends: array of 0-based exclusive region ends
+        '''
+        chr = self.chrname(chr)
+        if chr not in self.index or len(starts) == 0:
+            return
+        length, offset, linebases, linewidth = self.index[chr]
+        starts = np.minimum(np.asarray(starts, dtype=np.int64), length)
+        ends = np.minimum(np.asarray(ends, dtype=np.int64), length)
+        first = (offset + (starts // linebases) * linewidth + starts % linebases) // self.block_size
+        last = (offset + (ends // linebases) * linewidth + ends % linebases) // self.block_size
+
+        # Expand each region to its block range
+        counts = last - first + 1
+        blocks = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+        self.planned = np.unique(np.concatenate((self.planned, blocks)))
+
+    def byte_range(self, chr, start, end):
+        '''
+        Return the byte range in the file of the 0-based sequence range [start, end)
+        '''
+        length, offset, linebases, linewidth = self.index[chr]
+        end = min(end, length)
+        start = min(start, end)
+        return offset + (start // linebases) * linewidth + start % linebases, \
+               offset + (end // linebases) * linewidth + end % linebases
+
+    def read(self, b0, b1):
+        if b1 <= b0:
+            return b""
+        bs = self.block_size
+        pieces = []
+        for b in range(b0 // bs, (b1 - 1) // bs + 1):
+            data = self.block(b)
+            pieces.append(data[max(b0 - b * bs, 0):b1 - b * bs])
+        return b"".join(pieces)
+
+    def block(self, b):
+        if b in self.blocks:
+            self.blocks.move_to_end(b)
+            return self.blocks[b]
+
+        data = self.read_disk_block(b)
+        if data is None:
+            data = self.fetch(b)
+        else:
+            self.cache_block(b, data)
+        return data
+
+    def fetch(self, b):
+        '''
+        Fetch block b, together with the planned blocks that follow it, in a single range request
+        :return: the data of block b
+        '''
+        run_end = b + 1
+        i = np.searchsorted(self.planned, b, side='right')
+        while i < len(self.planned) and self.planned[i] == run_end and run_end - b < self.max_request_blocks \
+                and run_end not in self.blocks and not self.has_disk_block(run_end):
+            run_end += 1
+            i += 1
+
+        bs = self.block_size
+        r = self.session.get(self.url, headers={"Range": f"bytes={b * bs}-{run_end * bs - 1}"})
+        self.requests += 1
+        if r.status_code == 206:
+            content = r.content
+        elif r.status_code == 200:
+            # Server ignored the range header
+            content = r.content[b * bs:run_end * bs]
+        else:
+            raise IOError(f"Error reading {self.url}: {r.status_code}")
+
+        for k in range(b, run_end):
+            data = content[(k - b) * bs:(k - b + 1) * bs]
+            if len(data) == 0:
+                break
+            self.cache_block(k, data)
+            self.write_disk_block(k, data)
+        if self.cache_dir is not None:
+            self.trim_disk_cache()
+
+        # Fetched blocks are no longer pending
+        self.planned = self.planned[(self.planned < b) | (self.planned >= run_end)]
+        return content[:bs]
+
+    def cache_block(self, b, data):
+        self.blocks[b] = data
+        self.blocks.move_to_end(b)
+        while len(self.blocks) > self.memory_blocks:
+            self.blocks.popitem(last=False)
+
+    def has_disk_block(self, b):
+        return self.cache_dir is not None and os.path.exists(os.path.join(self.cache_dir, str(b)))
+
+    def read_disk_block(self, b):
+        if not self.has_disk_block(b):
+            return None
+        path = os.path.join(self.cache_dir, str(b))
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+
+    def write_disk_block(self, b, data):
+        if self.cache_dir is None:
+            return
+        path = os.path.join(self.cache_dir, str(b))
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def trim_disk_cache(self):
+        '''
+        Evict the least recently used blocks from the disk cache once it exceeds its capacity
+        '''
+        names = [n for n in os.listdir(self.cache_dir) if n.isdigit()]
+        if len(names) <= self.disk_blocks:
+            return
+        paths = [os.path.join(self.cache_dir, n) for n in names]
+        paths.sort(key=lambda p: os.stat(p).st_mtime)
+        for p in paths[:len(paths) - self.disk_blocks]:
+            os.remove(p)
+
+    def set_aliases(self, aliases):
+        '''
+        Replace the alias table with chromosome names resolved up front, see chralias.resolve_aliases
+        '''
+        self.aliastable = aliases
+
+    def chrname(self, chr):
+        return self.aliastable[chr] if chr in self.aliastable else chr
+
+    def size(self, chr):
+        return self.sizes[self.chrname(chr)]
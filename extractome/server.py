@@ -0,0 +1,319 @@
+import argparse
+import io
+import json
+import os
+import queue
+import shutil
+import socketserver
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from extractome.chralias import read_chromalias
+from extractome.extract import extract_genome, non_negative_int, parse_args as parse_extract_args, positive_int
+from extractome.fasta import BACKENDS, open_fasta
+from extractome.genome import get_genome
+
+# Request parameters passed on as extraction options, and how each is validated
+EXTRACT_OPTIONS = {
+    "name": ("--name", str),
+    "pad": ("--pad", non_negative_int),
+    "merge_gap": ("--merge-gap", non_negative_int),
+    "line_width": ("--line-width", positive_int),
+    "feature_type": ("--feature-type", str),
+    "attribute": ("--attribute", str)
+}
+EXTRACT_FLAGS = {"twobit": "--twobit", "bgzip": "--bgzip"}
+REGION_FORMATS = ["bed", "gff", "gtf"]
+
+
+class ReaderPool:
+    '''
+    Open readers of one reference.  A reader is used by one request at a time; readers are opened on demand and
+    kept for later requests, so the number open follows the number of concurrent requests.  One reader is opened
+    up front so the first request finds the reference warm.
+    :param alias_rows: chromosome alias rows of the reference, as returned by read_chromalias, if any
+    '''
+
+    def __init__(self, fasta, fasta_index=None, cache_dir=None, backend=None, alias_rows=None):
+        self.fasta = fasta
+        self.fasta_index = fasta_index
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.alias_rows = alias_rows
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.idle.put(self.open())
+
+    def open(self):
+        self.opened += 1
+        return open_fasta(self.fasta, self.fasta_index, self.cache_dir, self.backend)
+
+    @contextmanager
+    def reader(self):
+        try:
+            reader = self.idle.get_nowait()
+        except queue.Empty:
+            reader = self.open()
+        try:
+            yield reader
+        finally:
+            self.idle.put(reader)
+
+
+class ExtractionService:
+    '''
+    Extracts genomes for requests against references kept open in memory.  References are registered by name,
+    either a local fasta or 2bit file, or an igv.js genome id whose definition is resolved once.  Genome ids not
+    registered up front are resolved from the catalog on their first request.
+    :param work_dir: directory for the temporary files of requests, default the system temporary directory
+    '''
+
+    def __init__(self, cache_dir=None, offline=False, backend=None, work_dir=None):
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.backend = backend
+        self.work_dir = work_dir
+        self.pools = {}
+        self.loading = {}
+        self.lock = threading.Lock()
+
+    def add_fasta(self, name, fasta, fasta_index=None, chrom_alias=None):
+        '''
+        Open a reference.  Its chromosome alias file, if any, is parsed once and kept with the readers.
+        '''
+        alias_rows = read_chromalias(chrom_alias) if chrom_alias else None
+        pool = ReaderPool(fasta, fasta_index, self.cache_dir, self.backend, alias_rows)
+        with self.lock:
+            self.pools[name] = pool
+        return pool
+
+    def add_genome(self, id):
+        '''
+        Resolve an igv.js genome definition and open its reference
+        '''
+        genome = get_genome(id, cache_dir=self.cache_dir, offline=self.offline)
+        if genome is None:
+            raise ValueError(f"Genome {id} could not be resolved")
+        fasta = genome.get("fastaURL") or genome.get("twoBitURL")
+        return self.add_fasta(id, fasta, genome.get("indexURL"), genome.get("chromAliasURL"))
+
+    def pool(self, name):
+        '''
+        The readers of a reference, loading a genome id on its first request.  The lock guards the dictionaries
+        only, so a genome being loaded does not hold up requests for references already open.  Concurrent requests
+        for a genome being loaded wait for the one load, which is retried by a later request if it fails.
+        '''
+        with self.lock:
+            if name in self.pools:
+                return self.pools[name]
+            future = self.loading.get(name)
+            load = future is None
+            if load:
+                future = self.loading[name] = Future()
+        if load:
+            try:
+                future.set_result(self.add_genome(name))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    del self.loading[name]
+        return future.result()
+
+    def references(self):
+        with self.lock:
+            return {name: pool.fasta for name, pool in self.pools.items()}
+
+    def extract(self, params, regions):
+        '''
+        Extract a genome for one request
+        :param params: dictionary of request parameter -> list of values, as from urllib.parse.parse_qs.  "genome"
+            names the reference, the others are extraction options, see EXTRACT_OPTIONS and EXTRACT_FLAGS.
+        :param regions: content of the regions file, bytes
+        :return: tuple (archive name, gzipped tar archive of the output files, bytes)
+        '''
+        if "genome" not in params:
+            raise ValueError("Missing parameter: genome")
+        format = params.get("format", ["bed"])[0]
+        if format not in REGION_FORMATS:
+            raise ValueError(f"Unknown format '{format}', expected one of {', '.join(REGION_FORMATS)}")
+        name = params.get("name", ["Xome"])[0]
+        if not name or os.path.basename(name) != name or name.startswith('.'):
+            raise ValueError(f"Invalid name: {name}")
+
+        options = []
+        for key, values in params.items():
+            if key in EXTRACT_OPTIONS:
+                option, convert = EXTRACT_OPTIONS[key]
+                for value in values:
+                    try:
+                        convert(value)
+                    except (ValueError, argparse.ArgumentTypeError):
+                        raise ValueError(f"Invalid value for {key}: {value}")
+                    options += [option, value]
+            elif key in EXTRACT_FLAGS:
+                if values[-1].lower() in ("1", "true", "yes"):
+                    options.append(EXTRACT_FLAGS[key])
+            elif key not in ("genome", "format"):
+                raise ValueError(f"Unknown parameter: {key}")
+
+        pool = self.pool(params["genome"][0])
+        tmpdir = tempfile.mkdtemp(dir=self.work_dir)
+        try:
+            regions_file = os.path.join(tmpdir, f"regions.{format}")
+            with open(regions_file, "wb") as f:
+                f.write(regions)
+            output = os.path.join(tmpdir, "output")
+            args = parse_extract_args([regions_file, "--fasta", pool.fasta, "--output", output, "--format", format] +
+                                      options)
+
+            with pool.reader() as reader:
+                extract_genome(args, (pool.fasta_index, reader), pool.alias_rows)
+
+            return f"{name}.tar.gz", archive(output, name)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def archive(output, name):
+    '''
+    Gzipped tar archive of the files of an extraction, in a directory called name.  The manifest for incremental
+    runs is left out.
+    '''
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for file in sorted(os.listdir(output)):
+            if not file.endswith(".manifest.json"):
+                tar.add(os.path.join(output, file), arcname=f"{name}/{file}")
+    return buffer.getvalue()
+
+
+class ExtractionRequestHandler(BaseHTTPRequestHandler):
+    '''
+    POST /extract?genome=ID[&option=value...] with the regions file as the request body returns a gzipped tar
+    archive of the extracted genome.  GET /references lists the references loaded.
+    '''
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/references":
+            self.send_data(200, "application/json", json.dumps(self.server.service.references()).encode('utf-8'))
+        else:
+            self.send_data(404, "text/plain", b"Not found\n")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/extract":
+            self.send_data(404, "text/plain", b"Not found\n")
+            return
+        regions = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        start = time.perf_counter()
+        try:
+            name, data = self.server.service.extract(parse_qs(url.query), regions)
+        except (ValueError, KeyError) as e:
+            self.send_data(400, "text/plain", f"{e}\n".encode('utf-8'))
+            return
+        except Exception as e:
+            self.send_data(500, "text/plain", f"{type(e).__name__}: {e}\n".encode('utf-8'))
+            return
+        self.send_data(200, "application/gzip", data, {
+            "Content-Disposition": f'attachment; filename="{name}"',
+            "X-Extraction-Seconds": f"{time.perf_counter() - start:.4f}"
+        })
+
+    def send_data(self, status, content_type, data, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.log_requests:
+            super().log_message(format, *args)
+
+
+class UnixExtractionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host="127.0.0.1", port=8000, socket_path=None, log_requests=True):
+    '''
+    Create a threading http server for the service, on host and port, or on a Unix socket if socket_path is given
+    '''
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixExtractionServer(socket_path, ExtractionRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ExtractionRequestHandler)
+    server.service = service
+    server.log_requests = log_requests
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve extractions from references kept open in memory")
+    parser.add_argument("--fasta", action="append", default=[], metavar="NAME=PATH",
+                        help="register a local fasta or 2bit reference under a name, may be repeated")
+    parser.add_argument("--chrom-alias", action="append", default=[], metavar="NAME=PATH",
+                        help="chromosome alias file for a reference registered with --fasta, may be repeated")
+    parser.add_argument("--genome", action="append", default=[],
+                        help="igv.js genome id to load at startup, may be repeated.  Others are loaded on first request")
+    parser.add_argument("--fasta-backend", choices=BACKENDS, default="pysam", help="reader for local fasta files")
+    parser.add_argument("--cache-dir", default=None, help="directory for the cached genome catalog, default ~/.cache/extractome")
+    parser.add_argument("--offline", action="store_true", help="resolve genomes from the cached catalog only")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on, default 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on, default 8000")
+    parser.add_argument("--socket", default=None, help="listen on this Unix socket instead of a port")
+    parser.add_argument("--work-dir", default=None, help="directory for temporary request files")
+    parser.add_argument("--quiet", action="store_true", help="do not log requests")
+    return parser.parse_args(argv)
+
+
+def split_named(values):
+    named = {}
+    for v in values:
+        name, sep, path = v.partition('=')
+        if not sep:
+            raise ValueError(f"Expected NAME=PATH: {v}")
+        named[name] = path
+    return named
+
+
+def main():
+    args = parse_args()
+    service = ExtractionService(args.cache_dir, args.offline, args.fasta_backend, args.work_dir)
+    aliases = split_named(args.chrom_alias)
+    for name, path in split_named(args.fasta).items():
+        service.add_fasta(name, path, chrom_alias=aliases.get(name))
+    for id in args.genome:
+        service.add_genome(id)
+
+    server = make_server(service, args.host, args.port, args.socket, not args.quiet)
+    print(f"Serving {', '.join(service.pools) or 'genomes on request'} on "
+          f"{args.socket or f'http://{args.host}:{server.server_address[1]}'}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,55 @@
 import gzip
 import io
+import os
+import threading
+import zlib
 import requests
+from requests.adapters import HTTPAdapter
 
-def getstream(file):
+# Default size of the chunks read from an http response, and of the buffer lines are read from
+CHUNK_SIZE = 1 << 16
+BUFFER_SIZE = 1 << 16
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Connections kept open per host by the shared http session
+POOL_SIZE = 16
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    '''
+    The http session shared by all remote reads of this process.  Its connection pool is sized for concurrent use
+    from several threads.  Forked worker processes get their own session rather than the parent's sockets.
+    '''
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def getstream(file, chunk_size=CHUNK_SIZE, buffer_size=BUFFER_SIZE):
+    '''
+    Open a local file or url as a text stream.  Remote content is streamed, parsing can start as soon as the first
+    bytes arrive, and ".gz" content is decompressed incrementally.
+    :param chunk_size: size of the chunks read from an http response
+    :param buffer_size: size of the read buffer for http responses
+    '''
     # TODO -- gcs
 
     if file.startswith('http://') or file.startswith('https://'):
-        response = requests.get(file)
-        status_code = response.status_code  # TODO Do something with this
-
-        if file.endswith('.gz'):
-            content = response.content
-            text = gzip.decompress(content).decode('utf-8')
-        else:
-            text = response.text
-        f = io.StringIO(text)
-        return f
+        response = get_session().get(file, stream=True)
+        response.raise_for_status()
+        raw = ResponseStream(response, chunk_size, file.endswith('.gz'))
+        return io.TextIOWrapper(io.BufferedReader(raw, buffer_size), encoding='utf-8')
 
     elif file.endswith('.gz'):
         f = gzip.open(file, mode='rt')
@@ -26,4 +60,52 @@ def getstream(file):
     return f
 
 
+class ResponseStream(io.RawIOBase):
+    '''
+    Raw binary stream over the body of a streamed http response, optionally gunzipping it chunk by chunk.
+    Concatenated gzip members (e.g. bgzip files) are supported.
+    '''
+
+    def __init__(self, response, chunk_size=CHUNK_SIZE, gzipped=False):
+        self.response = response
+        self.chunks = response.iter_content(chunk_size)
+        self.gzipped = gzipped
+        self.decompressor = None
+        self.first = True
+        self.data = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self.data) == 0:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.data = memoryview(self.decompress(chunk))
+
+        n = min(len(b), len(self.data))
+        b[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+    def decompress(self, chunk):
+        if self.first:
+            # The server or requests may already have decoded the content
+            self.first = False
+            self.gzipped = self.gzipped and chunk.startswith(GZIP_MAGIC)
+            if self.gzipped:
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        if not self.gzipped:
+            return chunk
+
+        out = self.decompressor.decompress(chunk)
+        while self.decompressor.eof and self.decompressor.unused_data:
+            rest = self.decompressor.unused_data
+            self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            out += self.decompressor.decompress(rest)
+        return out
 
+    def close(self):
+        self.response.close()
+        super().close()
@@ -0,0 +1,356 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from extractome import regions
+from extractome.chralias import build_aliastable
+from extractome.fasta import CHUNK_SIZE, LINE_WIDTH
+
+# UCSC .2bit format, see https://genome.ucsc.edu/FAQ/FAQformat.html#format7
+TWOBIT_SIGNATURE = 0x1A412743
+
+# Bases in order of their 2 bit codes
+TWOBIT_BASES = b"TCAG"
+
+# The 4 bases, as upper case ASCII, of each packed byte value.  Viewed as one uint32 per byte value, so that
+# unpacking is a single table lookup per 4 bases.
+UNPACK = np.frombuffer(TWOBIT_BASES, dtype=np.uint8)[
+    (np.arange(256, dtype=np.uint8)[:, None] >> np.array([6, 4, 2, 0], dtype=np.uint8)) & 3].reshape(-1).view(np.uint32)
+
+
+def is_twobit(path):
+    return path.lower().endswith(".2bit")
+
+
+class TwoBitReader:
+    '''
+    Reader for a local UCSC .2bit file with the FastaReader interface.  The file is memory mapped, the index of
+    sequence offsets is part of the file itself.  Ranges are decoded with a lookup table from packed bytes to
+    4 bases at a time, N and lower case (soft mask) blocks overlapping the range are then applied in bulk.
+    Non-ACGT bases other than N are not representable in .2bit and read as N.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.bytes = np.frombuffer(self.mm, dtype=np.uint8)
+
+        signature, version, count, _ = struct.unpack_from("<4I", self.mm, 0)
+        self.endian = "<"
+        if signature != TWOBIT_SIGNATURE:
+            self.endian = ">"
+            signature, version, count, _ = struct.unpack_from(">4I", self.mm, 0)
+            if signature != TWOBIT_SIGNATURE:
+                raise ValueError(f"Not a 2bit file: {path}")
+        if version not in (0, 1):
+            raise ValueError(f"Unsupported 2bit version {version}: {path}")
+
+        offset_format = self.endian + ("Q" if version == 1 else "I")
+        offset_size = struct.calcsize(offset_format)
+        self.offsets = {}
+        pos = 16
+        for _ in range(count):
+            size = self.mm[pos]
+            name = self.mm[pos + 1:pos + 1 + size].decode('ascii')
+            self.offsets[name] = struct.unpack_from(offset_format, self.mm, pos + 1 + size)[0]
+            pos += 1 + size + offset_size
+
+        self.sizes = {name: struct.unpack_from(self.endian + "I", self.mm, offset)[0]
+                      for name, offset in self.offsets.items()}
+        self.records = {}
+        self.aliastable = build_aliastable(list(self.offsets.keys()))
+
+    def record(self, chr):
+        '''
+        Header of a sequence record, decoded on first use
+        :return: tuple (dna offset, N block starts, N block ends, mask block starts, mask block ends)
+        '''
+        record = self.records.get(chr)
+        if record is None:
+            if chr not in self.offsets:
+                raise KeyError(f"sequence '{chr}' not present")
+            pos = self.offsets[chr] + 4
+            u4 = np.dtype(self.endian + "u4")
+            blocks = []
+            for _ in range(2):
+                count = struct.unpack_from(self.endian + "I", self.mm, pos)[0]
+                starts = np.frombuffer(self.mm, u4, count, pos + 4).astype(np.int64)
+                sizes = np.frombuffer(self.mm, u4, count, pos + 4 + 4 * count).astype(np.int64)
+                blocks += [starts, starts + sizes]
+                pos += 4 + 8 * count
+            record = self.records[chr] = (pos + 4,) + tuple(blocks)
+        return record
+
+    def slice(self, region):
+        if isinstance(region, str):
+            region = regions.parse_region(region)
+        return bytes(self.view(region["chr"], region["start"] - 1, region["end"])).decode('ascii')
+
+    def prefetch(self, chr, starts, ends):
+        '''
+        Advise the kernel that the given regions are about to be read
+        '''
+        chr = self.chrname(chr)
+        if chr not in self.offsets or len(starts) == 0 or not hasattr(self.mm, "madvise"):
+            return
+        dna_offset = self.record(chr)[0]
+        b0 = dna_offset + int(min(starts)) // 4
+        b1 = min(dna_offset + (int(max(ends)) + 3) // 4, len(self.mm))
+        page = b0 - b0 % mmap.PAGESIZE
+        if b1 > page:
+            self.mm.madvise(mmap.MADV_WILLNEED, page, b1 - page)
+
+    def chunks(self, chr, start, end, chunk_size=CHUNK_SIZE):
+        '''
+        Generator yielding the sequence of chr:start-end as memoryviews of at most chunk_size bases
+        :param start: 0-based start, inclusive
+        :param end: 0-based end, exclusive
+        '''
+        for s in range(start, end, chunk_size):
+            yield self.view(chr, s, min(s + chunk_size, end))
+
+    def view(self, chr, start, end):
+        '''
+        Sequence of chr:start-end, 0-based half open, as a memoryview of bytes
+        '''
+        chr = self.chrname(chr)
+        dna_offset, n_starts, n_ends, mask_starts, mask_ends = self.record(chr)
+        start = max(0, start)
+        end = min(end, self.sizes[chr])
+        if end <= start:
+            return memoryview(b"")
+
+        b0 = start // 4
+        packed = self.bytes[dna_offset + b0:dna_offset + (end + 3) // 4]
+        seq = UNPACK[packed].view(np.uint8)[start - 4 * b0:end - 4 * b0]
+        for s, e in block_ranges(n_starts, n_ends, start, end):
+            seq[s:e] = ord('N')
+        for s, e in block_ranges(mask_starts, mask_ends, start, end):
+            seq[s:e] |= 0x20
+        return memoryview(seq)
+
+    def set_aliases(self, aliases):
+        '''
+        Replace the alias table with chromosome names resolved up front, see chralias.resolve_aliases
+        '''
+        self.aliastable = aliases
+
+    def chrname(self, chr):
+        return self.aliastable[chr] if chr in self.aliastable else chr
+
+    def size(self, chr):
+        return self.sizes[self.chrname(chr)]
+
+    def close(self):
+        self.bytes = None
+        try:
+            self.mm.close()
+        except BufferError:
+            # Views handed out are still alive, the mapping is released when they are
+            pass
+        self.file.close()
+
+
+def block_ranges(starts, ends, start, end):
+    '''
+    The parts of the sorted, non-overlapping blocks starts-ends within start-end, relative to start
+    :return: list of (start, end) tuples
+    '''
+    i0 = np.searchsorted(ends, start, side='right')
+    i1 = np.searchsorted(starts, end, side='left')
+    if i1 <= i0:
+        return []
+    return list(zip((np.maximum(starts[i0:i1], start) - start).tolist(), (np.minimum(ends[i0:i1], end) - start).tolist()))
+
+
+def base_codes(a):
+    '''
+    2 bit codes of ASCII bases, from bits 1-2 of the byte value, which distinguish A, C, G, and T in either case
+    :return: tuple (codes, mask of the non-ACGT bytes, or None if there are none)
+    '''
+    k = (a >> 1) & 3
+    codes = k ^ (((k & 1) ^ 1) << 1)
+    upper = a & 0xDF
+    other = (upper != ord('A')) & (upper != ord('C')) & (upper != ord('G')) & (upper != ord('T'))
+    if not other.any():
+        return codes, None
+    # Non-ACGT bytes are stored as T (0) and covered by an N block
+    codes[other] = 0
+    return codes, other
+
+
+class BlockCollector:
+    '''
+    Collects runs of flagged positions, e.g. N bases, over successive pieces of a sequence.  A run continuing
+    across pieces is joined into one block.
+    '''
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def add(self, flags, offset):
+        if flags is None or not flags.any():
+            return
+        bounds = np.concatenate(([0], np.flatnonzero(flags[1:] != flags[:-1]) + 1, [len(flags)]))
+        runs = flags[bounds[:-1]]
+        starts = bounds[:-1][runs] + offset
+        ends = bounds[1:][runs] + offset
+        if self.ends and starts[0] == self.ends[-1][-1]:
+            self.ends[-1][-1] = ends[0]
+            starts, ends = starts[1:], ends[1:]
+        if len(starts) > 0:
+            self.starts.append(starts)
+            self.ends.append(ends)
+
+    def blocks(self):
+        '''
+        :return: tuple (starts, sizes) as uint32 arrays
+        '''
+        if not self.starts:
+            return np.zeros(0, np.uint32), np.zeros(0, np.uint32)
+        starts = np.concatenate(self.starts)
+        return starts.astype(np.uint32), (np.concatenate(self.ends) - starts).astype(np.uint32)
+
+
+class TwoBitWriter:
+    '''
+    Writes a UCSC .2bit file record by record, with the FastaWriter interface.  Sequence is packed 4 bases per byte
+    as it is written and streamed to a temporary file next to the output, while N and lower case (mask) blocks are
+    collected.  The header and index, which precede the sequence in the file, are written on close.  Memory use is
+    independent of record size apart from the block lists.
+
+    Empty records are left out.
+
+    Usage:  writer.begin(name); writer.write(seq) ...; writer.end(); ...; writer.close()
+    :param line_width: line width of the fasta part files appended with append, see extract.write_parts
+    '''
+
+    def __init__(self, path, line_width=LINE_WIDTH):
+        self.path = path
+        self.line_width = line_width
+        self.dna_path = path + ".dna.tmp"
+        self.dna = open(self.dna_path, "wb")
+        self.dna_offset = 0
+        self.records = []        # (name, length, dna offset, dna bytes, N blocks, mask blocks)
+        self.name = None
+
+    def begin(self, name):
+        if self.name is not None:
+            self.end()
+        if len(name.encode('ascii')) > 255:
+            raise ValueError(f"Sequence name longer than 255 characters: {name}")
+        self.name = name
+        self.length = 0
+        self.record_offset = self.dna_offset
+        self.pending = np.zeros(0, dtype=np.uint8)
+        self.n_blocks = BlockCollector()
+        self.mask_blocks = BlockCollector()
+
+    def write(self, seq):
+        if isinstance(seq, str):
+            seq = seq.encode('ascii')
+        a = np.frombuffer(seq, dtype=np.uint8)
+        if len(a) == 0:
+            return
+        codes, other = base_codes(a)
+        self.n_blocks.add(other, self.length)
+        self.mask_blocks.add(a >= ord('a'), self.length)
+        self.length += len(a)
+
+        if len(self.pending) > 0:
+            codes = np.concatenate((self.pending, codes))
+        full = len(codes) // 4 * 4
+        self._write_packed(codes[:full])
+        self.pending = codes[full:]
+
+    def end(self):
+        if self.name is None:
+            return
+        if len(self.pending) > 0:
+            self._write_packed(np.concatenate((self.pending, np.zeros(4 - len(self.pending), dtype=np.uint8))))
+        if self.length > 0xFFFFFFFF:
+            raise ValueError(f"Sequence {self.name} is too long for a 2bit file")
+        if self.length == 0:
+            # Empty records are left out, as in fasta output
+            self.name = None
+            return
+        self.records.append((self.name, self.length, self.record_offset, self.dna_offset - self.record_offset,
+                             self.n_blocks.blocks(), self.mask_blocks.blocks()))
+        self.name = None
+
+    def close(self):
+        self.end()
+        self.dna.close()
+        try:
+            self._write_file()
+        finally:
+            os.remove(self.dna_path)
+
+    def append(self, path, index):
+        '''
+        Append complete records written to a fasta part file by a FastaWriter, e.g. by a worker process
+        :param index: the part writer's fai rows
+        '''
+        with open(path, "rb") as f:
+            for name, length, offset, linebases, linewidth in index:
+                self.begin(name)
+                f.seek(offset)
+                nbytes = (length // linebases) * linewidth + length % linebases
+                chunk = max(1, CHUNK_SIZE // linewidth) * linewidth
+                while nbytes > 0:
+                    data = f.read(min(nbytes, chunk))
+                    if not data:
+                        raise IOError(f"Unexpected end of file copying {name}")
+                    nbytes -= len(data)
+                    self.write(data.replace(b"\n", b"").replace(b"\r", b""))
+                self.end()
+
+    def _write_packed(self, codes):
+        # Each group of 4 codes c0-c3 read as a little endian uint32 v:  c0 << 6 | c1 << 4 | c2 << 2 | c3 is the low
+        # byte of v << 6 | v >> 4 | v >> 14 | v >> 24, as each code is at most 3
+        v = np.ascontiguousarray(codes).view("<u4")
+        packed = ((v << 6) | (v >> 4) | (v >> 14) | (v >> 24)).astype(np.uint8)
+        self.dna.write(packed.tobytes())
+        self.dna_offset += len(packed)
+
+    def _write_file(self):
+        names = [r[0].encode('ascii') for r in self.records]
+        headers = [4 * (4 + 2 * len(r[4][0]) + 2 * len(r[5][0])) for r in self.records]
+        data_size = sum(headers) + sum(r[3] for r in self.records)
+
+        # 64 bit offsets (version 1) only if the file exceeds 4 GB
+        version = 0
+        index_size = sum(1 + len(n) + 4 for n in names)
+        if 16 + index_size + data_size > 0xFFFFFFFF:
+            version = 1
+            index_size = sum(1 + len(n) + 8 for n in names)
+
+        with open(self.path, "wb") as o:
+            o.write(struct.pack("<4I", TWOBIT_SIGNATURE, version, len(self.records), 0))
+            offset = 16 + index_size
+            for name, header, r in zip(names, headers, self.records):
+                o.write(struct.pack("<B", len(name)) + name + struct.pack("<Q" if version == 1 else "<I", offset))
+                offset += header + r[3]
+
+            with open(self.dna_path, "rb") as dna:
+                for name, length, dna_offset, dna_bytes, n_blocks, mask_blocks in self.records:
+                    o.write(struct.pack("<2I", length, len(n_blocks[0])))
+                    o.write(n_blocks[0].astype("<u4").tobytes() + n_blocks[1].astype("<u4").tobytes())
+                    o.write(struct.pack("<I", len(mask_blocks[0])))
+                    o.write(mask_blocks[0].astype("<u4").tobytes() + mask_blocks[1].astype("<u4").tobytes())
+                    o.write(struct.pack("<I", 0))
+                    dna.seek(dna_offset)
+                    while dna_bytes > 0:
+                        data = dna.read(min(dna_bytes, CHUNK_SIZE))
+                        o.write(data)
+                        dna_bytes -= len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
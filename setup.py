@@ -22,11 +22,15 @@ setuptools.setup(name='extractome',
                      'Topic :: Scientific/Engineering :: Bio-Informatics '
                  ],
                  install_requires=[
-                     'pysam', 'intervalTree', 'requests'
+                     'pysam', 'numpy', 'requests'
                  ],
                  entry_points={
                      'console_scripts': [
                          'extractome=extractome.extract:main',
+                         'extractome-batch=extractome.batch:main',
+                         'extractome-liftover=extractome.liftover:main',
+                         'extractome-coords=extractome.coordmap:main',
+                         'extractome-server=extractome.server:main',
                      ],
                  }
                  )
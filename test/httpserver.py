@@ -0,0 +1,98 @@
+import functools
+import os
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    '''
+    Static file handler with support for single byte range requests.  Requests are counted on the server, which
+    also tracks the largest number handled at once.  Each request is delayed by the server's delay to simulate
+    latency.
+    '''
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.track(super().do_GET)
+
+    def do_HEAD(self):
+        self.track(super().do_HEAD)
+
+    def track(self, handle):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.delay)
+            handle()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def send_head(self):
+        self.server.request_count += 1
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if range_header is None or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start, end = range_header.replace("bytes=", "").split("-")
+        start = int(start)
+        end = min(int(end) if end else size - 1, size - 1)
+
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.range_remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "range_remaining", None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        outputfile.write(source.read(remaining))
+
+
+class LocalHTTPServer:
+    '''
+    Serve a directory on localhost in a background thread, standing in for a remote server in tests.
+    '''
+
+    def __init__(self, directory, delay=0):
+        handler = functools.partial(RangeRequestHandler, directory=directory)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.request_count = 0
+        self.httpd.delay = delay
+        self.httpd.lock = threading.Lock()
+        self.httpd.active = 0
+        self.httpd.max_active = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    @property
+    def max_active(self):
+        return self.httpd.max_active
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.httpd.shutdown()
+        self.httpd.server_close()
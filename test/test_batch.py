@@ -0,0 +1,48 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from extractome.batch import extract_batch, parse_args
+from extractome.extract import extract_genome, parse_args as parse_extract_args
+from test_extract import read, write_test_data
+
+
+class BatchTest(unittest.TestCase):
+
+    def test_batch(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fasta, bed = write_test_data(tmpdir)
+
+            # Second set:  every other region of the first, plus an overlapping region
+            with open(bed) as f:
+                lines = f.readlines()
+            bed2 = os.path.join(tmpdir, "regions2.bed")
+            with open(bed2, "w") as f:
+                f.writelines(lines[::2])
+                f.write("chr1\t100\t2000\toverlap\n")
+
+            manifest = os.path.join(tmpdir, "batch.tsv")
+            with open(manifest, "w") as f:
+                f.write("#name\tregions\nA\tregions.bed\nB\tregions2.bed\n")
+
+            for options in [[], ["--merge-gap", "0", "--bgzip"]]:
+                batch_out = os.path.join(tmpdir, "batch")
+                extract_batch(parse_args([manifest, "--fasta", fasta, "--output", batch_out] + options))
+
+                # Each set matches a separate run of extract_genome
+                for name, regions in [("A", bed), ("B", bed2)]:
+                    single_out = os.path.join(tmpdir, "single")
+                    extract_genome(parse_extract_args([regions, "--fasta", fasta, "--name", name,
+                                                       "--output", single_out] + options))
+                    fa = f"{name}.fa.gz" if options else f"{name}.fa"
+                    for f in [fa, fa + ".fai", f"{name}.chain", f"{name}.regions.bed", f"{name}.json"]:
+                        self.assertEqual(read(os.path.join(single_out, f)), read(os.path.join(batch_out, f)))
+
+    def test_invalid_options(self):
+
+        for option, value in [("--line-width", "0"), ("--line-width", "-5"), ("--pad", "-1")]:
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                parse_args(["manifest.tsv", option, value])
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from extractome.coordmap import CoordinateMap, coordmap_from_chain, load_coordmap
+
+
+class CoordinateMapTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        starts = np.sort(rng.integers(0, 10000, 100))
+        ends = starts + rng.integers(1, 300, 100)
+        self.coordmap = CoordinateMap()
+        self.coordmap.add("chr1", starts, ends)
+
+        # Original position of each extracted base.  Regions overlap, so original positions can repeat.
+        self.origin = np.concatenate([np.arange(s, e) for s, e in zip(starts.tolist(), ends.tolist())])
+
+    def check(self, coordmap):
+        origin = self.origin
+        positions = np.arange(-5, len(origin) + 5)
+        expected = np.array([origin[p] if 0 <= p < len(origin) else -1 for p in positions.tolist()])
+        self.assertTrue(np.array_equal(expected, coordmap.reverse_positions("chr1", positions)))
+
+        points = np.arange(0, 10400)
+        rows, mapped = coordmap.forward_positions("chr1", points)
+        pairs = sorted(zip(points[rows].tolist(), mapped.tolist()))
+        self.assertEqual(sorted((int(o), p) for p, o in enumerate(origin.tolist())), pairs)
+
+        # Intervals map to the union of their bases' mappings, and back
+        rows, mstarts, mends = coordmap.forward("chr1", [1000, 5000], [1500, 5001])
+        for row, (s, e) in enumerate([(1000, 1500), (5000, 5001)]):
+            mapped = set()
+            for ms, me in zip(mstarts[rows == row].tolist(), mends[rows == row].tolist()):
+                mapped.update(range(ms, me))
+            self.assertEqual({p for p, o in enumerate(origin.tolist()) if s <= o < e}, mapped)
+
+        rows, ostarts, oends = coordmap.reverse("chr1", [100, 0], [2000, len(origin) + 10])
+        for row, (s, e) in enumerate([(100, 2000), (0, len(origin))]):
+            bases = np.concatenate([np.arange(a, b) for a, b in
+                                    zip(ostarts[rows == row].tolist(), oends[rows == row].tolist())])
+            self.assertTrue(np.array_equal(origin[s:e], bases))
+
+        self.assertEqual(0, len(coordmap.forward("chrX", [0], [10])[0]))
+
+    def test_map(self):
+        self.check(self.coordmap)
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            index = os.path.join(tmpdir, "X.coords")
+            self.coordmap.save(index)
+            self.check(load_coordmap(index))
+
+            chain = os.path.join(tmpdir, "X.chain")
+            self.coordmap.write_chain(chain, lambda chr: 20000)
+            self.check(coordmap_from_chain(chain))
@@ -0,0 +1,350 @@
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import pysam
+
+from extractome import extsort
+from extractome.extract import extract_genome, parse_args
+from extractome.fasta import open_fasta
+from extractome.feature import parse, parse_columns
+from extractome.liftover import load_liftover
+from extractome.twobit import TwoBitWriter
+
+
+def write_test_data(dir):
+    '''
+    Write a small random reference fasta and an unsorted bed file of regions over it
+    '''
+    random.seed(11)
+    chroms = {"chr1": 30000, "chr2": 15000, "chr10": 12000, "chrX": 5000}
+
+    fasta = os.path.join(dir, "ref.fa")
+    with open(fasta, "w") as f:
+        for chr, size in chroms.items():
+            seq = ''.join(random.choice('ACGTNacgt') for _ in range(size))
+            f.write(f">{chr}\n")
+            for i in range(0, size, 70):
+                f.write(seq[i:i + 70] + "\n")
+
+    rows = []
+    for chr, size in chroms.items():
+        for i in range(20):
+            start = random.randrange(0, size - 500)
+            rows.append((chr, start, start + random.randrange(1, 500), f"r{i}"))
+    random.shuffle(rows)
+
+    bed = os.path.join(dir, "regions.bed")
+    with open(bed, "w") as f:
+        for r in rows:
+            f.write("%s\t%d\t%d\t%s\n" % r)
+
+    return fasta, bed
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class ExtractTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+        self.fasta, self.bed = write_test_data(self.dir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def extract(self, output, *options):
+        args = parse_args([self.bed, "--fasta", self.fasta, "--name", "X",
+                           "--output", os.path.join(self.dir, output)] + list(options))
+        extract_genome(args)
+        return os.path.join(self.dir, output)
+
+    def test_extract(self):
+
+        out = self.extract("serial")
+
+        ref = pysam.FastaFile(self.fasta)
+        xome = pysam.FastaFile(os.path.join(out, "X.fa"))
+
+        expected = {}
+        with open(self.bed) as f:
+            for line in f:
+                chr, start, end, name = line.split("\t")
+                expected.setdefault(chr, []).append((int(start), int(end)))
+        for chr, rlist in expected.items():
+            rlist.sort()
+            seq = ''.join(ref.fetch(chr, s, e) for s, e in rlist)
+            self.assertEqual(seq, xome.fetch(chr))
+
+    def test_threads(self):
+
+        serial = self.extract("serial")
+        parallel = self.extract("parallel", "--threads", "3")
+
+        for f in ["X.fa", "X.fa.fai", "X.chain", "X.regions.bed"]:
+            self.assertEqual(read(os.path.join(serial, f)), read(os.path.join(parallel, f)))
+
+    def test_chain(self):
+
+        out = self.extract("serial")
+
+        # Lifting the input regions with the written chain file reproduces regions.bed
+        liftover = load_liftover(os.path.join(out, "X.chain"))
+        regions = parse(self.bed, 'bed')
+        expected = set()
+        for r in regions:
+            for m in liftover.map(r):
+                expected.add((m.chr, m.start, m.end, m.name))
+
+        lifted = set()
+        with open(os.path.join(out, "X.regions.bed")) as f:
+            for line in f:
+                tokens = line.split("\t")
+                lifted.add((tokens[0], int(tokens[1]), int(tokens[2]), tokens[3]))
+
+        self.assertEqual(expected, lifted)
+
+    def test_merge(self):
+
+        out = self.extract("merged", "--merge-gap", "0", "--pad", "10")
+
+        # Merged regions never overlap, so chain gaps are non-negative
+        with open(os.path.join(out, "X.chain")) as f:
+            for line in f:
+                tokens = line.split()
+                if len(tokens) == 3:
+                    self.assertGreater(int(tokens[1]), 0)
+
+        ref = pysam.FastaFile(self.fasta)
+        xome = pysam.FastaFile(os.path.join(out, "X.fa"))
+        liftover = load_liftover(os.path.join(out, "X.chain"))
+        for r in parse(self.bed, 'bed'):
+            mapped = liftover.map(r)
+            self.assertEqual(1, len(mapped))
+            m = mapped[0]
+            self.assertEqual(ref.fetch(r.chr, r.start, r.end), xome.fetch(m.chr, m.start, m.end))
+
+    def test_bgzip(self):
+
+        plain = self.extract("plain")
+        compressed = self.extract("compressed", "--bgzip", "--threads", "2")
+
+        # Index offsets are in uncompressed coordinates, so the .fai matches the plain file's
+        self.assertEqual(read(os.path.join(plain, "X.fa.fai")), read(os.path.join(compressed, "X.fa.gz.fai")))
+        self.assertTrue(os.path.exists(os.path.join(compressed, "X.fa.gz.gzi")))
+
+        a = pysam.FastaFile(os.path.join(plain, "X.fa"))
+        b = pysam.FastaFile(os.path.join(compressed, "X.fa.gz"))
+        for chr in a.references:
+            self.assertEqual(a.fetch(chr), b.fetch(chr))
+            self.assertEqual(a.fetch(chr, 100, 900), b.fetch(chr, 100, 900))
+
+    def test_negative_options(self):
+
+        # Negative pads would write chains with negative sizes
+        for option in ["--pad", "--flank", "--merge-gap"]:
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                parse_args([self.bed, "--fasta", self.fasta, option, "-20"])
+        self.assertEqual(0, parse_args([self.bed, "--fasta", self.fasta, "--pad", "0"]).pad)
+
+        # A line width below 1 would divide by zero or write garbled records
+        for width in ["0", "-5"]:
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                parse_args([self.bed, "--fasta", self.fasta, "--line-width", width])
+        self.assertEqual(1, parse_args([self.bed, "--fasta", self.fasta, "--line-width", "1"]).line_width)
+
+    def test_empty_records(self):
+
+        # Zero length regions only on chrX:  nothing is extracted, so chrX is in none of the outputs
+        with open(self.bed) as f:
+            rows = [line.split("\t") for line in f]
+        for r in rows:
+            if r[0] == "chrX":
+                r[2] = r[1]
+        rows.sort(key=lambda r: (r[0], int(r[1])))
+        with open(self.bed, "w") as f:
+            f.write("".join("\t".join(r) for r in rows))
+
+        for options in [[], ["--sorted"], ["--twobit"]]:
+            out = self.extract("out" + "".join(options), *options)
+            chain = read(os.path.join(out, "X.chain")).decode()
+            self.assertIn(" chr2 ", chain)
+            self.assertNotIn(" chrX ", chain)
+            if options == ["--twobit"]:
+                self.assertNotIn("chrX", open_fasta(os.path.join(out, "X.2bit")).sizes)
+            else:
+                self.assertNotIn(b">chrX", read(os.path.join(out, "X.fa")))
+                self.assertEqual(["chr1", "chr10", "chr2"], list(pysam.FastaFile(os.path.join(out, "X.fa")).references))
+
+    def test_twobit(self):
+
+        plain = self.extract("plain")
+        twobit = self.extract("twobit", "--twobit", "--threads", "2")
+        with open(os.path.join(twobit, "X.json")) as f:
+            self.assertEqual("X.2bit", json.load(f)["twoBitURL"])
+
+        a = pysam.FastaFile(os.path.join(plain, "X.fa"))
+        b = open_fasta(os.path.join(twobit, "X.2bit"))
+        for chr in a.references:
+            self.assertEqual(a.fetch(chr), b.slice({"chr": chr, "start": 1, "end": b.size(chr)}))
+
+        # A 2bit copy of the reference gives the same extraction
+        ref = pysam.FastaFile(self.fasta)
+        self.fasta = os.path.join(self.dir, "ref.2bit")
+        with TwoBitWriter(self.fasta) as writer:
+            for chr in ref.references:
+                writer.begin(chr)
+                writer.write(ref.fetch(chr))
+                writer.end()
+        self.extract("from_twobit")
+        for f in ["X.fa", "X.fa.fai", "X.chain", "X.regions.bed"]:
+            self.assertEqual(read(os.path.join(plain, f)), read(os.path.join(self.dir, "from_twobit", f)))
+
+    def test_incremental(self):
+
+        for options in [[], ["--bgzip"]]:
+            fasta = "X.fa.gz" if options else "X.fa"
+            out = self.extract("incremental", "--incremental", *options)
+
+            # Change the regions of chr2 only
+            with open(self.bed) as f:
+                lines = f.readlines()
+            with open(self.bed, "w") as f:
+                for line in lines:
+                    tokens = line.split("\t")
+                    if tokens[0] == "chr2":
+                        tokens[2] = str(int(tokens[2]) + 5)
+                    f.write("\t".join(tokens))
+
+            # Mark the previous chr1 record, reused records are copied from the previous output
+            ref = pysam.FastaFile(os.path.join(out, fasta))
+            chr1 = ref.fetch("chr1")
+            ref.close()
+            if not options:
+                with open(os.path.join(out, fasta), "r+b") as f:
+                    f.seek(len(">chr1\n"))
+                    f.write(b"#")
+
+            self.extract("incremental", "--incremental", *options)
+            full = self.extract("full", *options)
+
+            xome = pysam.FastaFile(os.path.join(out, fasta))
+            expected = pysam.FastaFile(os.path.join(full, fasta))
+            self.assertEqual(expected.fetch("chr2"), xome.fetch("chr2"))
+            self.assertEqual(expected.fetch("chr10"), xome.fetch("chr10"))
+            self.assertEqual("#" + chr1[1:] if not options else chr1, xome.fetch("chr1"))
+            for f in [fasta + ".fai", "X.chain", "X.regions.bed"]:
+                self.assertEqual(read(os.path.join(full, f)), read(os.path.join(out, f)))
+            self.assertFalse(os.path.exists(os.path.join(out, fasta + ".prev")))
+            self.assertTrue(os.path.exists(os.path.join(out, "X.manifest.json")))
+
+        # Only incremental runs keep a manifest
+        self.assertFalse(os.path.exists(os.path.join(full, "X.manifest.json")))
+
+    def test_incremental_failure(self):
+
+        out = self.extract("incremental", "--incremental")
+        before = {f: read(os.path.join(out, f)) for f in os.listdir(out)}
+
+        # A failed run leaves the previous output in place, so the next run can still reuse it
+        with open(self.bed, "a") as f:
+            f.write("chr1\t1\t2\tnew\n")
+        with mock.patch("extractome.extract.write_record", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.extract("incremental", "--incremental")
+        self.assertEqual(before, {f: read(os.path.join(out, f)) for f in os.listdir(out)})
+
+    def test_chrom_alias(self):
+
+        serial = self.extract("serial")
+
+        # Rename the bed chromosomes:  "1" and "X" resolve by the chr prefix rule, "NC_000002.12" through the alias file
+        names = {"chr1": "1", "chr2": "NC_000002.12", "chr10": "chr10", "chrX": "X"}
+        with open(self.bed) as f:
+            lines = [line.split("\t", 1) for line in f]
+        with open(self.bed, "w") as f:
+            for chr, rest in lines:
+                f.write(f"{names[chr]}\t{rest}")
+        alias = os.path.join(self.dir, "chromAlias.txt")
+        with open(alias, "w") as f:
+            f.write("# ucsc\trefseq\nchr2\tNC_000002.12\n")
+
+        out = self.extract("alias", "--chrom-alias", alias, "--threads", "2")
+        expected = pysam.FastaFile(os.path.join(serial, "X.fa"))
+        xome = pysam.FastaFile(os.path.join(out, "X.fa"))
+        for chr, name in names.items():
+            self.assertEqual(expected.fetch(chr), xome.fetch(name))
+
+        # Unresolved names are reported before extraction
+        with self.assertRaises(ValueError) as e:
+            self.extract("unresolved")
+        self.assertIn("NC_000002.12", str(e.exception))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "unresolved", "X.fa")))
+
+    def test_metrics(self):
+
+        metrics_file = os.path.join(self.dir, "metrics.json")
+        self.extract("serial", "--metrics-out", metrics_file)
+
+        with open(metrics_file) as f:
+            metrics = json.load(f)
+        stages = {s["name"]: s for s in metrics["stages"]}
+        self.assertEqual(80, stages["load inputs"]["regions"])
+        self.assertEqual(os.path.getsize(os.path.join(self.dir, "serial", "X.fa")), stages["write fasta"]["bytes_written"])
+        self.assertTrue(all(s["seconds"] >= 0 for s in metrics["stages"]))
+
+    def test_sorted(self):
+
+        serial = self.extract("serial")
+
+        # Streaming a sorted copy of the regions gives the same output, one chromosome at a time
+        with open(self.bed) as f:
+            rows = [line.split("\t") for line in f]
+        rows.sort(key=lambda r: (r[0], int(r[1])))
+        with open(self.bed, "w") as f:
+            f.write("".join("\t".join(r) for r in rows))
+        streamed = self.extract("sorted", "--sorted")
+        for f in ["X.fa", "X.fa.fai", "X.chain", "X.regions.bed", "X.json"]:
+            self.assertEqual(read(os.path.join(serial, f)), read(os.path.join(streamed, f)))
+
+        # Unsorted input is detected while reading
+        rows[0], rows[1] = rows[1], rows[0]
+        with open(self.bed, "w") as f:
+            f.write("".join("\t".join(r) for r in rows))
+        with self.assertRaises(ValueError):
+            self.extract("unsorted", "--sorted")
+
+    def test_sort_memory(self):
+
+        # A budget of 7 regions spills 12 runs, merged in passes of 4
+        expected = {chr: c.sort() for chr, c in parse_columns(self.bed).items()}
+        with mock.patch.object(extsort, "MERGE_FANIN", 4):
+            merged = list(extsort.external_sort_bed(self.bed, 7 * extsort.BYTES_PER_REGION, tmp_root=self.dir))
+        self.assertEqual(sorted(expected.keys()), [c.chr for c in merged])
+        for c in merged:
+            self.assertEqual(expected[c.chr].starts.tolist(), c.starts.tolist())
+            self.assertEqual(expected[c.chr].ends.tolist(), c.ends.tolist())
+            self.assertEqual(expected[c.chr].names.tolist(), c.names.tolist())
+
+        # Unsorted input streamed through the external sort gives the output of the default pipeline
+        serial = self.extract("serial")
+        streamed = self.extract("external", "--sort-memory", "1")
+        for f in ["X.fa", "X.fa.fai", "X.chain", "X.regions.bed", "X.json"]:
+            self.assertEqual(read(os.path.join(serial, f)), read(os.path.join(streamed, f)))
+        self.assertEqual({"regions.bed", "ref.fa", "ref.fa.fai", "serial", "external"}, set(os.listdir(self.dir)))
+
+        # Budgets too small for one region are rejected rather than spilling a run per region
+        for budget in ["0", "-1"]:
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                parse_args([self.bed, "--fasta", self.fasta, "--sort-memory", budget])
+        with self.assertRaises(ValueError):
+            list(extsort.external_sort_bed(self.bed, extsort.BYTES_PER_REGION - 1, tmp_root=self.dir))
@@ -0,0 +1,120 @@
+import os
+import random
+import tempfile
+import unittest
+
+import pysam
+
+from extractome.fasta import FastaWriter, open_fasta
+from extractome.twobit import TwoBitWriter
+
+
+class FastaWriterTest(unittest.TestCase):
+
+    def test_write(self):
+
+        random.seed(7)
+        records = {
+            "chr1": ''.join(random.choice('ACGTN') for _ in range(1000)),
+            "chr2": "ACGT",
+            "chr3": ''.join(random.choice('acgt') for _ in range(120))
+        }
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.fa")
+
+            # Write in randomly sized pieces to exercise line wrapping across writes
+            with FastaWriter(path, 60) as writer:
+                for name, seq in records.items():
+                    writer.begin(name)
+                    pos = 0
+                    while pos < len(seq):
+                        n = random.randint(1, 150)
+                        writer.write(seq[pos:pos + n])
+                        pos += n
+                    writer.end()
+
+            with open(path) as f:
+                lines = f.read().split("\n")
+            self.assertTrue(all(len(l) <= 60 for l in lines))
+
+            # The inline index must match the one samtools builds
+            with open(path + ".fai") as f:
+                fai = f.read()
+            os.remove(path + ".fai")
+            pysam.faidx(path)
+            with open(path + ".fai") as f:
+                self.assertEqual(f.read(), fai)
+
+            fasta = pysam.FastaFile(path)
+            for name, seq in records.items():
+                self.assertEqual(seq, fasta.fetch(name))
+
+    def test_mmap(self):
+
+        random.seed(11)
+        records = {
+            "chr1": ''.join(random.choice('ACGTN') for _ in range(1000)),
+            "chr2": "ACGT",
+            "chr3": ''.join(random.choice('acgt') for _ in range(120))
+        }
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.fa")
+            with FastaWriter(path, 50) as writer:
+                for name, seq in records.items():
+                    writer.begin(name)
+                    writer.write(seq)
+                    writer.end()
+
+            # Windows line endings, indexed by samtools
+            crlf = os.path.join(tmpdir, "crlf.fa")
+            with open(path, "rb") as f, open(crlf, "wb") as out:
+                out.write(f.read().replace(b"\n", b"\r\n"))
+            pysam.faidx(crlf)
+
+            for p in [path, crlf]:
+                pysam_reader = open_fasta(p)
+                mmap_reader = open_fasta(p, backend="mmap")
+                self.assertEqual(pysam_reader.sizes, mmap_reader.sizes)
+                for name, seq in records.items():
+                    for _ in range(50):
+                        start = random.randint(0, len(seq) - 1)
+                        end = random.randint(start + 1, len(seq))
+                        self.assertEqual(seq[start:end], mmap_reader.slice({"chr": name, "start": start + 1, "end": end}))
+                    chunks = list(mmap_reader.chunks(name, 0, len(seq), 17))
+                    self.assertTrue(all(isinstance(c, memoryview) for c in chunks))
+                    self.assertEqual(seq.encode('ascii'), b"".join(chunks))
+                mmap_reader.close()
+
+    def test_twobit(self):
+
+        random.seed(5)
+        records = {
+            "chr1": ''.join(random.choice(['ACGT', 'acgt', 'NNNNNNNN', 'nn', 'GATTACA']) for _ in range(400)),
+            "chr2": "ACG",
+            "chr3": "N" * 37
+        }
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.2bit")
+            with TwoBitWriter(path) as writer:
+                for name, seq in records.items():
+                    writer.begin(name)
+                    pos = 0
+                    while pos < len(seq):
+                        n = random.randint(1, 150)
+                        writer.write(seq[pos:pos + n])
+                        pos += n
+                    writer.end()
+            self.assertEqual(["test.2bit"], os.listdir(tmpdir))
+
+            reader = open_fasta(path)
+            self.assertEqual({name: len(seq) for name, seq in records.items()}, reader.sizes)
+            for name, seq in records.items():
+                for _ in range(50):
+                    start = random.randint(0, len(seq) - 1)
+                    end = random.randint(start + 1, len(seq))
+                    self.assertEqual(seq[start:end], reader.slice({"chr": name, "start": start + 1, "end": end}))
+                self.assertEqual(seq.encode('ascii'), b"".join(reader.chunks(name, 0, len(seq), 17)))
+            reader.close()
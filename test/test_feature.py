@@ -0,0 +1,42 @@
+import io
+import pathlib
+import unittest
+
+from extractome.feature import parse, parse_bed_columns, parse_columns
+
+
+class FeatureTest(unittest.TestCase):
+
+    def test_parse_columns(self):
+
+        bedfile = str((pathlib.Path(__file__).parent / "data/cpgIsland_mm10.bed").resolve())
+        features = parse(bedfile, 'bed')
+        columns = parse_columns(bedfile)
+
+        self.assertEqual(len(features), sum(len(c) for c in columns.values()))
+
+        # Rows keep file order within each chromosome, and the lazy Feature view matches the object parser
+        by_chr = {}
+        for f in features:
+            by_chr.setdefault(f.chr, []).append(f)
+        for chr, flist in by_chr.items():
+            c = columns[chr]
+            self.assertEqual([f.start for f in flist], c.starts.tolist())
+            self.assertEqual([f.end for f in flist], c.ends.tolist())
+            for f, g in zip(flist[:10], c):
+                self.assertEqual(f.tostring(), g.tostring())
+
+    def test_chunks(self):
+
+        text = "track name=test\nchr2\t30\t40\tb\nchr1\t10\t20\ta\t5\n#comment\nchr2\t5\t8\n"
+        columns = parse_bed_columns(io.StringIO(text), read_size=8)
+
+        self.assertEqual(["chr2", "chr1"], list(columns.keys()))
+        self.assertEqual([30, 5], columns["chr2"].starts.tolist())
+        self.assertEqual(["b", ""], columns["chr2"].names.tolist())
+        self.assertEqual([None, None], columns["chr2"].scores.tolist())
+        self.assertEqual(["5"], columns["chr1"].scores.tolist())
+
+        s = columns["chr2"].sort()
+        self.assertEqual([5, 30], s.starts.tolist())
+        self.assertEqual(["", "b"], s.names.tolist())
@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+import unittest
+
+from extractome.genome import get_genome
+
+
+class GenomeTest(unittest.TestCase):
+
+    def test_cache(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+
+            # A local directory stands in for the genome catalog server
+            server = os.path.join(tmpdir, "server")
+            cache = os.path.join(tmpdir, "cache")
+            os.mkdir(server)
+            catalog = os.path.join(server, "genomes.json")
+            with open(catalog, "w") as f:
+                json.dump([{"id": "mm10", "fastaURL": "mm10.fa"}, {"id": "hg38", "fastaURL": "hg38.fa"}], f)
+
+            # Offline lookups fail until the catalog has been cached
+            with self.assertRaises(ValueError):
+                get_genome("hg38", catalog, cache_dir=cache, offline=True)
+
+            self.assertEqual("hg38.fa", get_genome("hg38", catalog, cache_dir=cache)["fastaURL"])
+
+            # Once cached the catalog resolves without the server
+            os.rename(catalog, catalog + ".bak")
+            self.assertEqual("mm10.fa", get_genome("mm10", catalog, cache_dir=cache, offline=True)["fastaURL"])
+            self.assertEqual("mm10.fa", get_genome("mm10", catalog, cache_dir=cache)["fastaURL"])
+
+            # An expired cache is revalidated and picks up changes
+            with open(catalog, "w") as f:
+                json.dump([{"id": "hg38", "fastaURL": "hg38.v2.fa"}], f)
+            self.assertEqual("hg38.fa", get_genome("hg38", catalog, cache_dir=cache)["fastaURL"])
+            self.assertEqual("hg38.v2.fa", get_genome("hg38", catalog, cache_dir=cache, ttl=0)["fastaURL"])
+
+            with self.assertRaises(ValueError):
+                get_genome("mm10", catalog, cache_dir=cache)
@@ -0,0 +1,112 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+
+import pysam
+
+from extractome.extract import extract_genome, parse_args
+from extractome.feature import parse, parse_gff
+from extractome.gff import GFFFilter, attribute_text_name, attributes_name, parse_attributes, parse_gff_columns, \
+    read_gff
+from test_extract import write_test_data
+
+
+def write_gtf(path, seed=2):
+    '''
+    Write a gtf of random genes on chr1 and chr2, each with two transcripts sharing some exons
+    '''
+    random.seed(seed)
+    lines = []
+    for i in range(40):
+        chr = random.choice(["chr1", "chr2"])
+        start = random.randrange(1, 14000)
+        gene_type = random.choice(["protein_coding", "lncRNA"])
+        gene = f'gene_id "G{i}"; gene_type "{gene_type}"; gene_name "GENE{i}";'
+        lines.append(f"{chr}\tTEST\tgene\t{start}\t{start + 900}\t.\t+\t.\t{gene}")
+        exons = sorted(random.sample(range(start, start + 800), 4))
+        for t in range(2):
+            for e in exons[t:t + 3]:
+                lines.append(f'{chr}\tTEST\texon\t{e}\t{e + random.randrange(20, 100)}\t.\t+\t.\t'
+                             f'{gene} transcript_id "G{i}.{t}"; tag "basic"; tag "CCDS";')
+    random.shuffle(lines)
+    with open(path, "w") as f:
+        f.write("##description: test\n")
+        f.write("\n".join(lines) + "\n")
+
+
+class GFFTest(unittest.TestCase):
+
+    def test_attributes(self):
+        self.assertEqual({"gene_id": "G1", "tag": "basic,CCDS"},
+                         parse_attributes('gene_id "G1"; tag "basic"; tag "CCDS";', gtf=True))
+        self.assertEqual({"ID": "gene:1", "Name": "A B"}, parse_attributes("ID=gene:1;Name=A%20B"))
+
+        # Names looked up without decoding all attributes match the names of the decoded attributes
+        for text, gtf in [('gene_id "G1"; transcript_id "T1"; gene_name "A";', True), ('gene_id "G1";', True),
+                          ("ID=g1;Name=A%20B", False), ("gene_Name=B;ID=g2", False), ("Parent=g1", False)]:
+            self.assertEqual(attributes_name(parse_attributes(text, gtf)), attribute_text_name(text, gtf))
+
+        text = "#c\nchr1\tS\tgene\t1\t10\t.\t-\t.\tID=g1;Name=G1\nchr1\tS\texon\t2\t5\t.\t-\t.\tParent=g1\n"
+        records = list(read_gff(io.StringIO(text)))
+        self.assertEqual(2, len(records))
+        self.assertIsNone(records[0]._attributes)
+        self.assertEqual((0, 10, "G1"), (records[0].start, records[0].end, records[0].name))
+
+        features = parse_gff(io.StringIO(text))
+        self.assertEqual([("G1", "-"), ("", "-")], [(f.name, f.strand) for f in features])
+
+    def test_columns(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gtf = os.path.join(tmpdir, "genes.gtf")
+            write_gtf(gtf)
+
+            gff_filter = GFFFilter(["exon"], {"gene_type": ["protein_coding"], "tag": ["CCDS"]})
+            with open(gtf) as f:
+                selected = [(r.chr, r.start, r.end) for r in read_gff(f, gff_filter, gtf=True)]
+            self.assertTrue(0 < len(selected) < len(parse(gtf, 'gtf')))
+
+            # Merging chunk by chunk gives the same regions as merging all at once
+            columns = parse_gff_columns(gtf, gff_filter)
+            chunked = parse_gff_columns(gtf, gff_filter, read_size=500)
+            for chr, c in columns.items():
+                self.assertEqual(c.starts.tolist(), chunked[chr].starts.tolist())
+                self.assertEqual(c.ends.tolist(), chunked[chr].ends.tolist())
+                self.assertEqual(c.names.tolist(), chunked[chr].names.tolist())
+
+                bases = set()
+                for r in selected:
+                    if r[0] == chr:
+                        bases.update(range(r[1], r[2]))
+                merged = set()
+                for s, e in zip(c.starts.tolist(), c.ends.tolist()):
+                    merged.update(range(s, e))
+                self.assertEqual(bases, merged)
+                self.assertTrue(all(c.starts[1:] > c.ends[:-1]))
+
+    def test_extract(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fasta, _ = write_test_data(tmpdir)
+            gtf = os.path.join(tmpdir, "genes.gtf")
+            write_gtf(gtf)
+
+            out = os.path.join(tmpdir, "out")
+            extract_genome(parse_args([gtf, "--fasta", fasta, "--name", "X", "--output", out,
+                                       "--feature-type", "exon", "--attribute", "gene_type=protein_coding",
+                                       "--flank", "10"]))
+
+            with open(gtf) as f:
+                selected = list(read_gff(f, GFFFilter(["exon"], {"gene_type": ["protein_coding"]}), gtf=True))
+            ref = pysam.FastaFile(fasta)
+            xome = pysam.FastaFile(os.path.join(out, "X.fa"))
+            for chr in {r.chr for r in selected}:
+                bases = set()
+                for r in selected:
+                    if r.chr == chr:
+                        bases.update(range(max(0, r.start - 10), min(r.end + 10, ref.get_reference_length(chr))))
+                seq = ref.fetch(chr)
+                self.assertEqual(''.join(seq[b] for b in sorted(bases)), xome.fetch(chr))
+
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+import pysam
+
+from extractome.extract import extract_genome, parse_args
+from httpserver import LocalHTTPServer
+from test_extract import read, write_test_data
+
+
+class InputsTest(unittest.TestCase):
+
+    def test_remote_inputs(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = os.path.join(tmpdir, "data")
+            os.mkdir(data)
+            fasta, bed = write_test_data(data)
+            pysam.faidx(fasta)
+
+            local = os.path.join(tmpdir, "local")
+            extract_genome(parse_args([bed, "--fasta", fasta, "--name", "X", "--output", local]))
+
+            # With latency on every request, the regions download overlaps the fetch of the fasta index
+            with LocalHTTPServer(data, delay=0.2) as server:
+                remote = os.path.join(tmpdir, "remote")
+                extract_genome(parse_args([server.url + "/regions.bed", "--fasta", server.url + "/ref.fa",
+                                           "--cache-dir", os.path.join(tmpdir, "cache"), "--name", "X",
+                                           "--output", remote]))
+                self.assertGreaterEqual(server.max_active, 2)
+
+            for f in ["X.fa", "X.fa.fai", "X.chain", "X.regions.bed"]:
+                self.assertEqual(read(os.path.join(local, f)), read(os.path.join(remote, f)))
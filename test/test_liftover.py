@@ -1,6 +1,8 @@
+import os
+import tempfile
 import unittest
 
-from extractome.liftover import Chain, load_liftover
+from extractome.liftover import Chain, Liftover, compile_liftover, lift_file, load_liftover
 from extractome.feature import parse, Feature
 import pathlib
 
@@ -105,3 +107,82 @@ class LiftoverTest(unittest.TestCase):
         f = Feature("chr1", 10, 20)
         mapped = liftover.map(f)
         self.assertEqual(0, len(mapped))
+
+    def test_map_many(self):
+
+        alignments = [(1725, 14679, 0), (3914, 2468, 0), (1535,)]
+
+        chain = Chain("chr1", 190687455, 4784516, 190687455, "chr1", 1650847, 0, 1650847, 1)
+        chain.set_alignments(alignments)
+        liftover = Liftover([chain])
+
+        boundary = 4784516 + 1725 + 14679
+        features = [Feature("chr1", 4784516 - 10, boundary + 10),
+                    Feature("chr2", 100, 200),
+                    Feature("chr1", 4784516 + 1725 - 10, 4784516 + 1725 + 10),
+                    Feature("chr1", 10, 20)]
+
+        rows, chrs, starts, ends = liftover.map_many([f.chr for f in features],
+                                                     [f.start for f in features],
+                                                     [f.end for f in features])
+
+        expected = []
+        for i, f in enumerate(features):
+            for m in liftover.map(f) or []:
+                expected.append((i, m.chr, m.start, m.end))
+        self.assertEqual(expected, list(zip(rows.tolist(), chrs, starts.tolist(), ends.tolist())))
+        self.assertEqual([0, 0, 2], rows.tolist())
+
+    def test_multiple_chains(self):
+
+        # Two chains on chr1, the second aligned to the reverse strand of chrB
+        text = """chain 1000 chr1 10000 + 100 300 chrA 5000 + 0 150 1
+100 100 50
+50
+
+chain 900 chr1 10000 + 1000 1100 chrB 1000 - 100 200 2
+100
+
+"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            chain_file = os.path.join(tmpdir, "test.chain")
+            with open(chain_file, "w") as f:
+                f.write(text)
+            index_dir = os.path.join(tmpdir, "test.idx")
+            compile_liftover(chain_file, index_dir)
+
+            for liftover in [load_liftover(chain_file), load_liftover(index_dir)]:
+
+                # Query gaps (dq) shift the second block of the first chain
+                mapped = liftover.map(Feature("chr1", 190, 310))
+                self.assertEqual([("chrA", 90, 100), ("chrA", 150, 160)], [(m.chr, m.start, m.end) for m in mapped])
+
+                # Reverse strand chain:  forward query coordinates, strand flipped
+                mapped = liftover.map(Feature("chr1", 1010, 1020))
+                self.assertEqual(1, len(mapped))
+                self.assertEqual(("chrB", 880, 890, '-'), (mapped[0].chr, mapped[0].start, mapped[0].end, mapped[0].strand))
+
+                # Both chains are used for a feature spanning them
+                rows, chrs, starts, ends, strands = liftover.map_many(["chr1", "chr1"], [1050, 250], [1500, 1010],
+                                                                      strands=True)
+                self.assertEqual([0, 1, 1], rows.tolist())
+                self.assertEqual(["chrB", "chrA", "chrB"], list(chrs))
+                self.assertEqual(["-", "+", "-"], list(strands))
+
+                # The scalar path of map agrees with map_many, including empty and unmapped intervals
+                intervals = [(s, s + n) for s in range(0, 1300, 37) for n in (0, 1, 60, 400)]
+                rows, chrs, starts, ends, strands = liftover.map_many("chr1", [i[0] for i in intervals],
+                                                                      [i[1] for i in intervals], strands=True)
+                expected = list(zip(rows.tolist(), chrs, starts.tolist(), ends.tolist(), strands))
+                mapped = [(i, m.chr, m.start, m.end, m.strand) for i, (s, e) in enumerate(intervals)
+                          for m in liftover.map(Feature("chr1", s, e))]
+                self.assertEqual(expected, mapped)
+
+            bed = os.path.join(tmpdir, "test.bed")
+            with open(bed, "w") as f:
+                f.write("chr1\t1010\t1020\tf1\t0\t+\textra\nchr2\t5\t10\tf2\t0\t+\textra\n")
+            lifted = os.path.join(tmpdir, "lifted.bed")
+            total, unmapped = lift_file(load_liftover(index_dir), bed, lifted)
+            self.assertEqual((2, 1), (total, unmapped))
+            with open(lifted) as f:
+                self.assertEqual("chrB\t880\t890\tf1\t0\t-\textra\n", f.read())
@@ -17,3 +17,27 @@ class RegionsTest(unittest.TestCase):
         self.assertEqual('chr1', m['chr'])
         self.assertEqual(1000, m['start'])
         self.assertEqual(3000, m['end'])
+
+    def test_merge_intervals(self):
+
+        starts = [100, 150, 300, 310, 1000, 1010, 2000]
+        ends = [200, 180, 310, 400, 1005, 1020, 2100]
+
+        merged_starts, merged_ends = regions.merge_intervals(starts, ends)
+        self.assertEqual([100, 300, 1000, 1010, 2000], merged_starts.tolist())
+        self.assertEqual([200, 400, 1005, 1020, 2100], merged_ends.tolist())
+
+        merged_starts, merged_ends = regions.merge_intervals(starts, ends, 5)
+        self.assertEqual([100, 300, 1000, 2000], merged_starts.tolist())
+        self.assertEqual([200, 400, 1020, 2100], merged_ends.tolist())
+
+    def test_pad_intervals(self):
+
+        starts, ends = regions.pad_intervals([10, 500], [20, 990], 50, 1000)
+        self.assertEqual([0, 450], starts.tolist())
+        self.assertEqual([70, 1000], ends.tolist())
+
+        with self.assertRaises(ValueError):
+            regions.pad_intervals([10], [20], -5)
+        with self.assertRaises(ValueError):
+            regions.merge_intervals([10, 30], [20, 40], -1)
@@ -0,0 +1,53 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+import pysam
+
+from extractome.remotefasta import RemoteFastaReader
+from httpserver import LocalHTTPServer
+
+
+class RemoteFastaTest(unittest.TestCase):
+
+    def test_slice(self):
+
+        random.seed(5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = os.path.join(tmpdir, "data")
+            os.mkdir(data)
+            fasta = os.path.join(data, "ref.fa")
+            with open(fasta, "w") as f:
+                for chr in ["chr1", "chr2"]:
+                    seq = ''.join(random.choice('ACGT') for _ in range(50000))
+                    f.write(f">{chr}\n")
+                    for i in range(0, len(seq), 60):
+                        f.write(seq[i:i + 60] + "\n")
+            pysam.faidx(fasta)
+            local = pysam.FastaFile(fasta)
+
+            starts = np.array(sorted(random.randrange(0, 49000) for _ in range(200)))
+            ends = starts + np.array([random.randrange(1, 1000) for _ in range(200)])
+
+            with LocalHTTPServer(data) as server:
+                cache = os.path.join(tmpdir, "cache")
+                reader = RemoteFastaReader(server.url + "/ref.fa", cache_dir=cache, block_size=4096)
+                self.assertEqual(50000, reader.size("2"))
+
+                # Planned regions are fetched in a few coalesced requests
+                reader.prefetch("chr1", starts, ends)
+                for s, e in zip(starts.tolist(), ends.tolist()):
+                    self.assertEqual(local.fetch("chr1", s, e), reader.slice({"chr": "chr1", "start": s + 1, "end": e}))
+                self.assertLess(reader.requests, 5)
+
+                # A second reader is served from the disk cache
+                reader = RemoteFastaReader(server.url + "/ref.fa", cache_dir=cache, block_size=4096)
+                for s, e in zip(starts.tolist(), ends.tolist()):
+                    self.assertEqual(local.fetch("chr1", s, e), reader.slice({"chr": "chr1", "start": s + 1, "end": e}))
+                self.assertEqual(0, reader.requests)
+
+                # Unplanned reads still work, one block at a time
+                seq = ''.join(reader.chunks("chr2", 100, 20000, 3000))
+                self.assertEqual(local.fetch("chr2", 100, 20000), seq)
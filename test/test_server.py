@@ -0,0 +1,150 @@
+import http.client
+import io
+import os
+import socket
+import tarfile
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from extractome.extract import extract_genome, parse_args
+from extractome.server import ExtractionService, make_server
+from test_extract import read, write_test_data
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def post(connection, url, body):
+    connection.request("POST", url, body)
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response.status, data
+
+
+def unpack(data):
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        return {m.name: tar.extractfile(m).read() for m in tar.getmembers()}
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+        fasta, bed = write_test_data(self.dir)
+        self.regions = read(bed)
+
+        self.service = ExtractionService(work_dir=self.dir)
+        self.pool = self.service.add_fasta("test", fasta)
+
+        # Reference output of the command line tool
+        self.expected = os.path.join(self.dir, "expected")
+        extract_genome(parse_args([bed, "--fasta", fasta, "--name", "X", "--output", self.expected]))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def serve(self, server):
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def check(self, data):
+        files = unpack(data)
+        for f in ["X.fa", "X.fa.fai", "X.chain", "X.regions.bed", "X.json"]:
+            self.assertEqual(read(os.path.join(self.expected, f)), files[f"X/{f}"])
+
+    def test_http(self):
+
+        server = make_server(self.service, port=0, log_requests=False)
+        self.serve(server)
+        port = server.server_address[1]
+
+        status, data = post(http.client.HTTPConnection("127.0.0.1", port), "/extract?genome=test&name=X", self.regions)
+        self.assertEqual(200, status)
+        self.check(data)
+
+        # Concurrent requests each get a reader of their own, which is kept for later requests
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda _: post(http.client.HTTPConnection("127.0.0.1", port),
+                                                       "/extract?genome=test&name=X", self.regions), range(8)))
+        for status, data in results:
+            self.assertEqual(200, status)
+            self.check(data)
+        self.assertLessEqual(self.pool.opened, 4)
+        self.assertEqual(self.pool.opened, self.pool.idle.qsize())
+
+        for query in ["pad=x", "pad=-20", "merge_gap=-1", "line_width=0", "line_width=-5"]:
+            status, data = post(http.client.HTTPConnection("127.0.0.1", port), f"/extract?genome=test&{query}",
+                                self.regions)
+            self.assertEqual(400, status)
+        status, _ = post(http.client.HTTPConnection("127.0.0.1", port), "/extract?genome=test&name=../X", self.regions)
+        self.assertEqual(400, status)
+
+        # Request files are removed
+        self.assertEqual({"expected", "ref.fa", "ref.fa.fai", "regions.bed"}, set(os.listdir(self.dir)))
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets not available")
+    def test_unix_socket(self):
+
+        path = os.path.join(self.dir, "extractome.sock")
+        self.serve(make_server(self.service, socket_path=path, log_requests=False))
+
+        status, data = post(UnixHTTPConnection(path), "/extract?genome=test&name=X", self.regions)
+        self.assertEqual(200, status)
+        self.check(data)
+
+    def test_genome_loading(self):
+
+        # Rename chr2 in the regions, it resolves through the genome's alias file
+        alias = os.path.join(self.dir, "chromAlias.txt")
+        with open(alias, "w") as f:
+            f.write("# ucsc\trefseq\nchr2\tNC_000002.12\n")
+        regions = self.regions.replace(b"chr2\t", b"NC_000002.12\t")
+
+        # A genome being loaded does not hold up requests for references already open
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def get_genome(id, **kwargs):
+            calls.append(id)
+            started.set()
+            release.wait(10)
+            return {"fastaURL": self.pool.fasta, "chromAliasURL": alias}
+
+        with mock.patch("extractome.server.get_genome", get_genome), ThreadPoolExecutor(3) as executor:
+            first = executor.submit(self.service.pool, "hg38")
+            self.assertTrue(started.wait(10))
+            second = executor.submit(self.service.pool, "hg38")
+            self.assertIs(self.pool, executor.submit(self.service.pool, "test").result(timeout=10))
+            self.assertFalse(first.done())
+            release.set()
+            self.assertIs(first.result(timeout=10), second.result(timeout=10))
+
+        # Loaded once, with the alias rows parsed once
+        self.assertEqual(["hg38"], calls)
+        self.assertEqual([["chr2", "NC_000002.12"]], self.service.pools["hg38"].alias_rows)
+        self.assertEqual({}, self.service.loading)
+
+        name, data = self.service.extract({"genome": ["hg38"], "name": ["X"]}, regions)
+        expected = read(os.path.join(self.expected, "X.fa")).replace(b">chr2\n", b">NC_000002.12\n")
+        self.assertEqual(sorted(expected.split(b">")), sorted(unpack(data)["X/X.fa"].split(b">")))
+
+        # A failed load is reported to the request and retried by the next
+        with mock.patch("extractome.server.get_genome", return_value=None):
+            with self.assertRaises(ValueError):
+                self.service.pool("unknown")
+        self.assertEqual({}, self.service.loading)
@@ -0,0 +1,39 @@
+import gzip
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from extractome.stream import getstream
+from extractome.feature import parse_columns
+from httpserver import LocalHTTPServer
+
+
+class StreamTest(unittest.TestCase):
+
+    def test_remote(self):
+
+        bedfile = str((pathlib.Path(__file__).parent / "data/cpgIsland_mm10.bed").resolve())
+        with open(bedfile) as f:
+            expected = f.read()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shutil.copy(bedfile, os.path.join(tmpdir, "cpg.bed"))
+            with gzip.open(os.path.join(tmpdir, "cpg.bed.gz"), "wt") as f:
+                f.write(expected)
+
+            # Multi-member gzip, as written by bgzip
+            with open(os.path.join(tmpdir, "multi.bed.gz"), "wb") as f:
+                half = len(expected) // 2
+                f.write(gzip.compress(expected[:half].encode()))
+                f.write(gzip.compress(expected[half:].encode()))
+
+            with LocalHTTPServer(tmpdir) as server:
+                for name in ["cpg.bed", "cpg.bed.gz", "multi.bed.gz"]:
+                    with getstream(f"{server.url}/{name}", chunk_size=1000, buffer_size=512) as f:
+                        self.assertEqual(expected.split("\n")[0] + "\n", f.readline())
+                        self.assertEqual(expected, expected.split("\n")[0] + "\n" + f.read())
+
+                columns = parse_columns(f"{server.url}/cpg.bed.gz")
+                self.assertEqual(expected.count("\n"), sum(len(c) for c in columns.values()))